@@ -0,0 +1,161 @@
+import argparse, datetime, gc, importlib, json, multiprocessing, os, platform, subprocess, sys, time, tracemalloc
+
+# ==============================================================================================================================#
+# Benchmark harness
+# each build is run headless in its own worker process for a fixed seed and tick count, and measured three times over:
+# a plain run for ticks per second, a run with the rule phases wrapped in timers for per-phase timings, and a run under
+# tracemalloc for peak memory and the memory blocks still live at the end. results are saved as json so runs can be
+# compared across changes.
+#
+# usage: python bench.py --ticks 100 --out after.json --compare before.json
+
+# build folders and Simulation keyword arguments of each benchmark (the builds share module names, so are imported apart)
+BUILDS = {"wavespread": ("build02032022", {"engine": "tiles"}),
+          "wavespread-grid": ("build02032022", {"engine": "grid"}),
+          "block": ("build14022022", {"distance": True}),
+          "pygametest": ("build17022022", {})}
+
+# timed phases of each build: phase name -> (module, class or None for a module function, function name)
+# timings are exclusive, so time spent in a phase called from inside another phase is only counted towards the inner one.
+PHASES = {"wavespread": {"spread": [("gridengine", "SpreadKernel", "__call__"), ("wavespreadfullversion", "Tile", "SpreadTiles")],
+                         "distancing": [("wavespreadfullversion", "Tile", "distancewave")],
+                         "navigation": [("wavespreadfullversion", "Tile", "PersonNavigation"),
+                                        ("wavespreadfullversion", "Tile", "PersonMove")],
+                         "spawn": [("wavespreadfullversion", "Tile", "SpawnPeople")],
+                         "visuals": [("wavespreadfullversion", "Tile", "UpdateVisuals")]},
+          "wavespread-grid": {"spread": [("gridengine", "GridEngine", "SpreadTiles")],
+                              "distancing": [("gridengine", "GridEngine", "distancewave")],
+                              "navigation": [("gridengine", "GridEngine", "PersonNavigation"),
+                                             ("gridengine", "GridEngine", "PersonMove")],
+                              "spawn": [("gridengine", "GridEngine", "SpawnPeople")],
+                              "visuals": [("gridengine", "GridEngine", "UpdateVisuals")]},
+          "block": {"spread": [("mainblockversion", "Spreader", "BFSSpread"), ("mainblockversion", "Spreader", "BatchSpread")],
+                    "distancing": [("heatmaps", None, "add_circle"), ("heatmaps", None, "move_circle")],
+                    "navigation": [("blockpeople", "Population", "update")],
+                    "spawn": [("mainblockversion", "Simulation", "spawn_people")],
+                    "visuals": [("mainblockversion", "Tile", "update")]},
+          # the pygametest build spreads Pv and distancing with the same function, so both are timed as spread
+          "pygametest": {"spread": [("pygametest", "Tile", "SpreadTiles")],
+                         "navigation": [("pygametest", "Tile", "PersonRules")],
+                         "spawn": [("pygametest", "Tile", "SpawningRules")],
+                         "visuals": [("pygametest", "Tile", "UpdateVisuals")]}}
+
+def init_worker(build):
+    """Puts the build folder on the import path of a worker process."""
+    os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), BUILDS[build][0]))
+
+def simulate(build, seed, ticks):
+    """Builds and runs one simulation, returns the seconds spent building and running it, and the simulation."""
+    folder, params = BUILDS[build]
+    start = time.perf_counter()
+    if build == "block":
+        import mainblockversion as model
+        sim = model.Simulation(40, 220, seed=seed, **params)
+        built = time.perf_counter()
+        sim.run(ticks)
+    else:
+        model = importlib.import_module("pygametest" if build == "pygametest" else "wavespreadfullversion")
+        sim = model.Simulation(40, 220, seed=seed, **params)
+        built = time.perf_counter()
+        sim.run(ticks*(8 if build == "pygametest" else sim.ticksize))
+    return(built - start, time.perf_counter() - built, sim)
+
+def phase_profiler(build):
+    """A PhaseProfiler (from the build folder) over the timed phases of the build, never logging (results are read at the end)."""
+    from phaseprofiler import PhaseProfiler
+    phases = []
+    for phase, targets in PHASES[build].items():
+        for module, owner, name in targets:
+            target = importlib.import_module(module)
+            if owner is not None: target = getattr(target, owner)
+            phases.append((phase, target, name))
+    return(PhaseProfiler(phases, interval=0))
+
+def run_bench(task):
+    """Runs the three measurement passes of one build and returns its results."""
+    build, seed, ticks = task
+
+    # plain run, for throughput
+    setup, seconds, sim = simulate(build, seed, ticks)
+    del sim
+
+    # timed phases
+    profiler = phase_profiler(build).enable()
+    try:
+        simulate(build, seed, ticks)
+    finally:
+        profiler.disable()
+
+    # memory: peak traced memory and garbage collections over the whole run, memory and blocks still held by the model at the end
+    # (live_blocks counts the allocations alive when the run ends, not every allocation made during it: blocks allocated and
+    # freed within the run only show up in the peak memory and, for container objects, in the garbage collection counts)
+    gc.collect()
+    collections = [stats["collections"] for stats in gc.get_stats()]
+    tracemalloc.start()
+    sim = simulate(build, seed, ticks)[2]
+    current, peak = tracemalloc.get_traced_memory()
+    blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.stop()
+    del sim
+
+    return({"seed": seed, "ticks": ticks,
+            "setup_seconds": round(setup, 4),
+            "run_seconds": round(seconds, 4),
+            "ticks_per_second": round(ticks/seconds, 2),
+            "phases": {phase: {"seconds": round(profiler.seconds[phase], 4), "calls": profiler.calls[phase]} for phase in PHASES[build]},
+            "peak_memory_bytes": peak,
+            "final_memory_bytes": current,
+            "live_blocks": blocks,
+            "gc_collections": [stats["collections"] - before for stats, before in zip(gc.get_stats(), collections)]})
+
+def bench(builds, seed, ticks):
+    """Benchmarks each build in turn, each in a fresh worker process (so runs never compete for a core)."""
+    results = {}
+    for build in builds:
+        with multiprocessing.Pool(1, initializer=init_worker, initargs=(build,)) as pool:
+            results[build] = pool.apply(run_bench, ((build, seed, ticks),))
+    return(results)
+
+def environment():
+    """Machine and source revision the benchmark was run on."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return({"date": datetime.datetime.now().isoformat(timespec="seconds"), "commit": commit,
+            "python": platform.python_version(), "platform": platform.platform()})
+
+def compare(old, new):
+    """Prints the change in throughput, phase timings and peak memory of every build found in both result files."""
+    for build in new["results"]:
+        if build not in old["results"]: continue
+        a, b = old["results"][build], new["results"][build]
+        print(f"{build}: {a['ticks_per_second']} -> {b['ticks_per_second']} ticks/s ({b['ticks_per_second']/a['ticks_per_second']:.2f}x), "
+              f"peak memory {a['peak_memory_bytes']/1e6:.1f} -> {b['peak_memory_bytes']/1e6:.1f} MB")
+        for phase in b["phases"]:
+            if phase in a["phases"]:
+                print(f"    {phase}: {a['phases'][phase]['seconds']} -> {b['phases'][phase]['seconds']} s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the model builds headless, for a fixed seed and tick count.")
+    parser.add_argument("builds", nargs="*", metavar="build", help=f"builds to benchmark (default: all of {', '.join(BUILDS)})")
+    parser.add_argument("--ticks", type=int, default=100, help="ticks to simulate per run (frames in the block build)")
+    parser.add_argument("--seed", type=int, default=1256471)
+    parser.add_argument("--out", default=None, help="json file for the results (printed if not given)")
+    parser.add_argument("--compare", default=None, metavar="JSON", help="earlier results to compare against")
+    args = parser.parse_args()
+    for build in args.builds:
+        if build not in BUILDS: parser.error(f"unknown build {build!r}, choose from {', '.join(BUILDS)}")
+
+    report = environment()
+    report["results"] = bench(args.builds or list(BUILDS), args.seed, args.ticks)
+    if args.out:
+        with open(args.out, "w") as out: json.dump(report, out, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as old: compare(json.load(old), report)
@@ -0,0 +1,496 @@
+import heatmaps
+import numpy as np
+from randomstreams import RandomStreams
+
+# ==============================================================================================================================#
+# Grid engine utility tables
+
+# direction offsets (dy, dx) from a tile to its neighbour, listed in the order PersonMove scans them
+DIRECTIONS = ["L", "R", "U", "D", "UL", "UR", "DL", "DR"]
+OFFSETS = {"L":(0, -1), "R":(0, 1), "U":(-1, 0), "D":(1, 0), "UL":(-1, -1), "UR":(-1, 1), "DL":(1, -1), "DR":(1, 1)}
+
+# person directions are stored as integer codes, 0 = no person direction, n = DIRECTIONS[n-1]
+DIRCODES = {d: i + 1 for i, d in enumerate(DIRECTIONS)}
+reciprocals = {"R":"L", "L":"R", "U":"D", "D":"U", "UL":"DR", "UR":"DL", "DL":"UR", "DR":"UL"}
+
+# navigation preferences for each ai (same ordering as direction_preferences in the tile version)
+PREFERENCES = {1: ["L", "R", "U", "D", "UL", "UR", "DL", "DR"],
+               2: ["L", "D", "DL", "DR", "R", "UL", "UR", "U"],
+               3: ["R", "U", "UR", "UL", "L", "DR", "DL", "D"],
+               4: ["R", "UR", "DR", "U", "D", "UL", "DL", "L"],
+               5: ["L", "DL", "UL", "D", "U", "DR", "UR", "R"]}
+
+# distancing wave membership sets (u/d sets differ between boarder and departer waves, l/r sets are shared)
+BOARDER_UP, BOARDER_DOWN = [2, 5, 10], [1, 5, 10]
+DEPARTER_UP, DEPARTER_DOWN = [2, 5, 9], [1, 5, 9]
+WAVE_LEFT, WAVE_RIGHT = [1, 2, 3, 5, 6, 10], [1, 2, 4, 5, 6, 10]
+
+def wave_table(upset, downset):
+    """Distancing wave transition table: table[l, r, u, d] is the new wave type of a tile whose left, right, up and down"""
+    """neighbours previously had wave types l, r, u and d (0 when out of bounds). Wave types run from 0 to 10."""
+    types = np.arange(11)
+    l = np.isin(types, WAVE_LEFT)[:, None, None, None]
+    r = np.isin(types, WAVE_RIGHT)[None, :, None, None]
+    u = np.isin(types, upset)[None, None, :, None]
+    d = np.isin(types, downset)[None, None, None, :]
+    conditions = [np.broadcast_to(c, (11, 11, 11, 11)) for c in [u & d, u, d, l & r, l, r]]
+    return(np.select(conditions, [5, 2, 1, 6, 3, 4], 0).astype(np.int8))
+
+BOARDER_WAVES = wave_table(BOARDER_UP, BOARDER_DOWN)
+DEPARTER_WAVES = wave_table(DEPARTER_UP, DEPARTER_DOWN)
+
+# wave types above 6 (person sources) count down by one each subtick instead of spreading, reaching 6 resets them to 0
+COUNTDOWN = np.array([0, 1, 2, 3, 4, 5, 6, 0, 7, 8, 9], dtype=np.int8)
+
+# default spawn chances (percent) for boarders and walkers at the entrances, and for each type of departer at the exits
+SPAWNRATES = {"boarder": 5, "walker": 2, "departer": 5}
+
+# key names of the array state, matching the fields of the Tile state
+KEYS = ["Pv", "CanSpawn", "PersonDir", "PersonType", "Infection", "Carrier",
+        "BoarderWaveType", "BoarderWaveHistory", "DeparterWaveType", "DeparterWaveHistory"]
+
+def shifted(a, dy, dx, fill=0):
+    """Returns an array b such that b[y][x] = a[y+dy][x+dx], with out of bounds cells set to fill."""
+    height, width = a.shape[-2:]
+    pad = [(0, 0)]*(a.ndim - 2) + [(1, 1), (1, 1)]
+    p = np.pad(a, pad, constant_values=fill)
+    return(p[..., 1+dy:1+dy+height, 1+dx:1+dx+width])
+
+# bit length of every byte value
+BIT_LENGTHS = np.array([h.bit_length() for h in range(0, 256)], dtype=np.int16)
+
+def history_value(register):
+    """Distancing value of a wave history shift register (bit i set = wave present i subticks ago): the position of the"""
+    """oldest 1 + 2, or 0 for an empty history (bit_length + 1 of the register)."""
+    return(register.bit_length() + 1 if register else 0)
+
+def history_value_array(registers):
+    """Vectorized history_value of an array of registers, from the bit length of each register's highest non-zero byte plus"""
+    """that byte's offset (registers longer than 64 bits are held as Python integers, so are valued one at a time)."""
+    if registers.dtype == object: return(np.vectorize(history_value, otypes=[np.int16])(registers))
+    values = np.zeros(registers.shape, dtype=np.int16)
+    for offset in range(0, 8*registers.dtype.itemsize, 8):
+        byte = (registers >> offset) & 0xFF
+        values = np.where(byte != 0, BIT_LENGTHS[byte] + (offset + 1), values)
+    return(values)
+
+class ColourTable():
+    """Tile colours precomputed for every base colour, Pv and wave history value, so that drawing a tile is a few table lookups."""
+    """Each channel only depends on one index, so is kept as its own (base colour, index) table: red by Pv, green by departer"""
+    """history value and blue by boarder history value. Base colours are the air gradient (one per column) followed by the tile"""
+    """type palette."""
+    def __init__(self, colours, colourmap, historylength):
+        """colours: tile type palette (names mark types that are never shaded), colourmap: air colour of each column."""
+        self.palette = len(colourmap)   # base colour index of tile type 0
+        bases = [tuple(c) for c in colourmap] + [(0, 0, 0, 0) if isinstance(c, str) else tuple(c) for c in colours]
+        values = range(0, historylength + 2)
+        shade = max(8, historylength + 1)
+
+        # Pv reddens tiles, the departer/boarder distancing waves add green/blue
+        self.red = [[r + int((255-r)*(1 - (1 - Pv/30)**4)) for Pv in range(0, 31)] for (r, g, b, a) in bases]
+        self.green = [[g + int((255-g)*(v/shade)) for v in values] for (r, g, b, a) in bases]
+        self.blue = [[b + int((255-b)*(v/shade)) for v in values] for (r, g, b, a) in bases]
+        self.alpha = [a for (r, g, b, a) in bases]
+
+        # the same tables as arrays, for the array renderers
+        self.arrays = [np.array(channel, dtype=np.uint8) for channel in [self.red, self.green, self.blue]]
+
+    def colour(self, base, Pv, departer, boarder):
+        """The (r, g, b, a) colour of base colour base shaded by Pv and the departer/boarder history values."""
+        """Pv above 30 (possible with wind side weights above 1) is shaded as 30."""
+        return((self.red[base][min(Pv, 30)], self.green[base][departer], self.blue[base][boarder], self.alpha[base]))
+
+# ==============================================================================================================================#
+# Pv spread kernel
+
+class SpreadKernel():
+    """Pv spread as a 3x3 wind-weighted max-filter over a zero-padded integer array of the previous Pv values."""
+    def __init__(self, height, width):
+        # the one cell border stays zero, so out of bounds neighbours never spread (as with out of bounds neighbours being None)
+        self.height = height
+        self.width = width
+        self.padded = np.zeros((height + 2, width + 2), dtype=np.int16)
+
+    def weights(self, windmap):
+        """Filter weights: the neighbour at offset (dy, dx) spreads towards us with windmap[1-dy][1-dx], we don't spread to ourselves."""
+        weights = np.array(windmap, dtype=np.float64)[::-1, ::-1].copy()
+        weights[1][1] = 0
+        return(weights)
+
+    def __call__(self, pv, windmap):
+        """Returns max over the 8 neighbours of int(neighbour Pv * wind weight) for every tile (walls hold Pv 0, so never spread)."""
+        spread = np.zeros((self.height, self.width), dtype=np.int16)
+
+        # only the bounding box of non-zero Pv (grown by one tile) can receive any spread
+        rows, cols = np.nonzero(pv.any(axis=1))[0], np.nonzero(pv.any(axis=0))[0]
+        if len(rows) == 0: return(spread)
+        y0, y1 = max(rows[0] - 1, 0), min(rows[-1] + 2, self.height)
+        x0, x1 = max(cols[0] - 1, 0), min(cols[-1] + 2, self.width)
+        h, w = y1 - y0, x1 - x0
+
+        self.padded[1:-1, 1:-1] = pv
+        out = spread[y0:y1, x0:x1]
+        weights = self.weights(windmap)
+        for dy in range(0, 3):
+            for dx in range(0, 3):
+                if weights[dy][dx] != 0:
+                    nv = (self.padded[y0+dy:y0+dy+h, x0+dx:x0+dx+w]*weights[dy][dx]).astype(np.int16)
+                    np.maximum(out, nv, out=out)
+        return(spread)
+
+# ==============================================================================================================================#
+# Grid engine class
+
+class GridEngine():
+    """Array based engine: holds the whole grid state as NumPy arrays and steps it with the same rules as the Tile class."""
+
+    # ==============================================================================================================================#
+    # initialization
+
+    def __init__(self, grid, ticksize=9, historylength=3, rng=None, spawnrates=SPAWNRATES, infectivity=100, stats=None):
+        """Initialization function, builds the state arrays from a grid of tile types (as made by Window.initialize_grid)."""
+        """Random numbers are drawn from the given RandomStreams (a fresh randomly seeded one by default)."""
+        self.typ = np.array(grid, dtype=np.int8)
+        self.prevtyp = self.typ.copy()
+        self.height, self.width = self.typ.shape
+        self.ticksize = ticksize
+        self.historylength = historylength
+        self.historymask = (1 << historylength) - 1
+        self.historytype = np.min_scalar_type(self.historymask)     # uint8 registers for histories of up to 8 subticks (objects past 64)
+        self.rng = RandomStreams() if rng is None else rng
+        self.spawnrates = spawnrates
+        self.infectivity = infectivity
+        self.stats = {"infections": 0, "boarded": 0, "departed": 0, "peakpv": 0} if stats is None else stats
+
+        # tiles that need redrawing after the latest update (same conditions as Tile.UpdateVisuals)
+        self.updated = np.zeros(self.typ.shape, dtype=bool)
+        self.redraw = self.typ != 0
+
+        self.weights = [(2,0), (0,2), (0,2), (0,2), (0,2)]
+        self.initialheat = np.array([heatmaps.Base.boarding.map,
+                                     heatmaps.Base.departing.map,
+                                     heatmaps.Base.departing.map,
+                                     heatmaps.Base.left.map,
+                                     heatmaps.Base.right.map], dtype=np.float64)
+        self.xs = np.broadcast_to(np.arange(self.width), self.typ.shape)
+        self.ys = np.broadcast_to(np.arange(self.height)[:, None], self.typ.shape)
+
+        self.State = self.blank_state()
+        self.PrevState = self.blank_state()
+        self.kernel = SpreadKernel(self.height, self.width)
+
+    def blank_state(self):
+        """Produces a state in which every tile is uninhabited, quiet and able to spawn."""
+        shape = (self.height, self.width)
+        return({"Pv": np.zeros(shape, dtype=np.int16),
+                "CanSpawn": np.ones(shape, dtype=bool),
+                "PersonDir": np.zeros(shape, dtype=np.int8),
+                "PersonType": np.zeros(shape, dtype=np.int8),
+                "Infection": np.zeros(shape, dtype=bool),
+                "Carrier": np.zeros(shape, dtype=bool),
+                "BoarderWaveType": np.zeros(shape, dtype=np.int8),
+                "BoarderWaveHistory": np.zeros(shape, dtype=self.historytype),
+                "DeparterWaveType": np.zeros(shape, dtype=np.int8),
+                "DeparterWaveHistory": np.zeros(shape, dtype=self.historytype)})
+
+    # ==============================================================================================================================#
+    # spread ruleset
+
+    def SpreadTiles(self, live, windmap):
+        """Sets Pv to the largest wind-weighted value of the previous neighbour Pvs, carriers emit the maximum Pv of 30."""
+        S, P = self.State, self.PrevState
+        pv = np.maximum(S["Pv"], self.kernel(P["Pv"], windmap))
+
+        carriers = (self.typ >= 5) & (self.typ <= 9) & S["Carrier"]
+        S["Pv"] = np.where(live, np.where(carriers, 30, pv), S["Pv"]).astype(np.int16)
+
+    def distancewave(self, live, zero=False):
+        """Distancing wave spread, on zero frames wave types are cleared and the histories are reset."""
+        S, P = self.State, self.PrevState
+        if zero:
+            S["BoarderWaveType"][live] = 0
+            S["DeparterWaveType"][live] = 0
+            for h in ["BoarderWaveHistory", "DeparterWaveHistory"]:
+                S[h][live] = 1 << (self.historylength - 1)
+            S["CanSpawn"][live] = True
+            return()
+
+        # boarder waves counting down from a person source skip the rest of the update
+        countdown = live & (S["BoarderWaveType"] > 6)
+        S["BoarderWaveType"] = np.where(countdown, COUNTDOWN[S["BoarderWaveType"]], S["BoarderWaveType"])
+        S["DeparterWaveType"][countdown & (S["BoarderWaveType"] == 0)] = 5
+
+        active = live & ~countdown
+        self.wave(active, "BoarderWaveType", "BoarderWaveHistory", BOARDER_WAVES)
+
+        countdown = active & (S["DeparterWaveType"] > 6)
+        S["DeparterWaveType"] = np.where(countdown, COUNTDOWN[S["DeparterWaveType"]], S["DeparterWaveType"])
+        S["BoarderWaveType"][countdown & (S["DeparterWaveType"] == 0)] = 5
+
+        self.wave(active & ~countdown, "DeparterWaveType", "DeparterWaveHistory", DEPARTER_WAVES)
+
+    def wave(self, mask, key, histkey, table):
+        """Applies one wave transition table (indexed by the previous l, r, u, d neighbour wave types) to the masked tiles."""
+        S, P = self.State, self.PrevState
+        p = np.pad(P[key], 1)
+        new = table[p[1:-1, :-2], p[1:-1, 2:], p[:-2, 1:-1], p[2:, 1:-1]]
+        S[key][mask] = new[mask]
+
+        spread = mask & (new != 0)
+        S[histkey][spread] |= 1
+        S["CanSpawn"][spread] = False
+
+    # ==============================================================================================================================#
+    # person updating ruleset
+
+    def PersonMove(self, live):
+        """Moves people onto tiles whose neighbours have a person heading towards them (first match in DIRECTIONS order)."""
+        S, P = self.State, self.PrevState
+        source = np.full(self.typ.shape, -1, dtype=np.int8)
+        for i, d in list(enumerate(DIRECTIONS))[::-1]:
+            dy, dx = OFFSETS[d]
+            match = shifted(P["PersonDir"], dy, dx) == DIRCODES[d]
+            source[match] = i
+
+        moved = live & (source > -1)
+        if not moved.any(): return()
+
+        # gather the moving person's data from the source neighbour
+        ys, xs = np.nonzero(moved)
+        sy = ys + np.array([OFFSETS[d][0] for d in DIRECTIONS])[source[ys, xs]]
+        sx = xs + np.array([OFFSETS[d][1] for d in DIRECTIONS])[source[ys, xs]]
+
+        persontype = P["PersonType"][sy, sx]
+        self.typ[ys, xs] = persontype
+        S["BoarderWaveType"][ys[persontype == 5], xs[persontype == 5]] = 10
+        S["DeparterWaveType"][ys[persontype != 5], xs[persontype != 5]] = 10
+        S["Carrier"][ys, xs] = P["Carrier"][sy, sx]
+        S["Infection"][ys, xs] = P["Infection"][sy, sx]
+
+        # infection chances are rolled in row-major order to consume random numbers in the same order as the tile loop
+        for y, x in zip(ys, xs):
+            if not S["Infection"][y, x]:
+                self.stats["peakpv"] = max(self.stats["peakpv"], int(S["Pv"][y, x]))
+                chance = self.rng.infection.randint(1, 100)
+                if chance < int(int(S["Pv"][y, x])*self.infectivity/30):
+                    S["Infection"][y, x] = True
+                    self.stats["infections"] += 1
+
+        S["CanSpawn"][ys, xs] = False
+        self.updated[ys, xs] = True
+
+    def PersonNavigation(self, live):
+        """Outer function controlling person navigation, includes the despawn conditions."""
+        S, P = self.State, self.PrevState
+        ai = self.typ.astype(np.int16) - 4
+        people = live & (ai >= 1) & (ai <= 5)
+
+        # despawn rules
+        boarded = people & (ai == 1) & (self.prevtyp == 4)
+        self.typ[boarded] = self.prevtyp[boarded]
+        self.updated[boarded] = True
+        self.stats["boarded"] += int(boarded.sum())
+
+        walked = people & (((ai == 4) & (self.xs == 219)) | ((ai == 5) & (self.xs == 0)))
+        self.typ[walked], self.prevtyp[walked] = 3, 3
+        self.updated[walked] = True
+
+        # movement
+        movers = people & ~boarded & ~walked
+        if movers.any(): self.move_person(movers, ai)
+
+    def move_person(self, movers, ai):
+        """Functionality handling how people move. All movers test tiles in their preference order simultaneously."""
+        S = self.State
+        ys, xs = np.nonzero(movers)
+        ais = ai[ys, xs]
+
+        # heat of every tile (and every out of bounds neighbour) for each ai
+        v1 = history_value_array(self.PrevState["BoarderWaveHistory"])
+        v2 = history_value_array(self.PrevState["DeparterWaveHistory"])
+        heat = np.stack([self.getheat(a, v1, v2) for a in range(1, 6)])
+        heat = np.pad(heat, [(0, 0), (1, 1), (1, 1)], constant_values=10000000)
+
+        mini = heat[ais - 1, ys + 1, xs + 1]
+        bestd = np.full(len(ys), -1, dtype=np.int8)
+        for k in range(0, 8):
+            d = np.array([DIRCODES[PREFERENCES[a][k]] - 1 for a in range(1, 6)])[ais - 1]
+            dy = np.array([OFFSETS[n][0] for n in DIRECTIONS])[d]
+            dx = np.array([OFFSETS[n][1] for n in DIRECTIONS])[d]
+            t = heat[ais - 1, ys + 1 + dy, xs + 1 + dx]
+            better = (t < mini) | ((t == mini) & (bestd == -1))
+            mini = np.where(better, t, mini)
+            bestd = np.where(better, d, bestd)
+
+        boarders = ais == 1
+        S["BoarderWaveType"][ys[boarders], xs[boarders]] = 10
+        S["DeparterWaveType"][ys[~boarders], xs[~boarders]] = 10
+        S["CanSpawn"][ys, xs] = False
+
+        moving = bestd > -1
+        ys, xs, bestd = ys[moving], xs[moving], bestd[moving]
+        S["PersonType"][ys, xs] = self.typ[ys, xs]
+        S["PersonDir"][ys, xs] = [DIRCODES[reciprocals[DIRECTIONS[d]]] for d in bestd]
+        self.typ[ys, xs] = self.prevtyp[ys, xs]
+        self.updated[ys, xs] = True
+
+    def getheat(self, ai, v1, v2):
+        """Heat values of all tiles for the given ai, given the boarder (v1) and departer (v2) history values of the previous state."""
+        w1, w2 = self.weights[ai-1]
+        return(self.initialheat[ai-1] + w1*v1 + w2*v2)
+
+    # ==============================================================================================================================#
+    # person spawn ruleset
+
+    def SpawnPeople(self, live):
+        """Function for spawning people, entrance and exit tiles are visited in row-major order (as random numbers are consumed)."""
+        S, P = self.State, self.PrevState
+        x, y = self.xs, self.ys
+        rates = self.spawnrates
+        entrances = (self.typ == 3) & (((x < 5) & (y == 30)) | ((x > 215) & (y == 30)) | (x == 195))
+        exits = (self.typ == 4) & (x == 110)
+
+        for ty, tx in zip(*np.nonzero(live & (entrances | exits))):
+            if self.typ[ty, tx] == 3:
+                if tx < 5 and ty == 30:                         # left entrance
+                    if P["CanSpawn"][ty, tx + 1]:
+                        chance = self.rng.spawn.randint(1, 100)
+                        if chance <= rates["boarder"]: self.spawn_person(ty, tx, "R", 5)                        # 5% chance of spawning boarder
+                        elif chance <= rates["boarder"] + rates["walker"]: self.spawn_person(ty, tx, "R", 8)    # 2% chance of spawning right walker
+
+                elif tx > 215 and ty == 30:                     # right entrance
+                    if P["CanSpawn"][ty, tx - 1]:
+                        chance = self.rng.spawn.randint(1, 100)
+                        if chance <= rates["boarder"]: self.spawn_person(ty, tx, "L", 5)                        # 5% chance of spawning boarder
+                        elif chance <= rates["boarder"] + rates["walker"]: self.spawn_person(ty, tx, "L", 9)    # 2% chance of spawning left walker
+
+                else:                                           # upper entrances
+                    if P["CanSpawn"][ty + 1, tx]:
+                        chance = self.rng.spawn.randint(1, 100)
+                        if chance <= rates["boarder"]: self.spawn_person(ty, tx, "D", 5)                        # 5% chance of spawning boarder
+
+            else:                                               # exit tiles
+                if P["CanSpawn"][ty - 1, tx]:
+                    chance = self.rng.spawn.randint(1, 100)
+                    if chance <= rates["departer"]: self.spawn_person(ty, tx, "U", 6)                           # 5% chance of spawning a departer of each type
+                    elif chance <= 2*rates["departer"]: self.spawn_person(ty, tx, "U", 7)
+
+    def spawn_person(self, y, x, d, typ):
+        S = self.State
+        S["PersonType"][y, x] = typ
+        S["PersonDir"][y, x] = DIRCODES[reciprocals[d]]
+        carrier = self.rng.spawn.randint(0, 1) == 0
+        if typ in [6, 7]: self.stats["departed"] += 1
+        S["Infection"][y, x], S["Carrier"][y, x] = carrier, carrier
+
+    # ==============================================================================================================================#
+    # overall update ruleset
+
+    def UpdateRules(self, tick, windmap):
+        """Function controlling the update rules, applied to every non-wall tile at once."""
+        subtick = round(tick*self.ticksize) % self.ticksize
+        live = self.typ != 0
+        self.SpreadTiles(live, windmap)                 # pv spread
+
+        # motion frames
+        if subtick == self.ticksize - 1:
+            self.distancewave(live, True)               # zero out distancing spread
+
+            if round(tick) % 4 == 0:
+                self.SpawnPeople(live)                  # on every 4th motion frame, attempt spawning
+
+            self.PersonNavigation(live)                 # have people plan navigation
+
+        # motion frames
+        elif subtick == 0:
+            self.PersonMove(live)                       # move people
+
+        else:
+            self.distancewave(live)                     # distancing spread
+
+    # ==============================================================================================================================#
+    # visuals and post-processing update
+
+    def UpdateVisuals(self, tick, windmap):
+        """Swaps states, decays Pv and shifts histories. Controls the periodic arrival of buses and marks tiles to redraw."""
+        self.PrevState = self.State
+        P = self.PrevState
+        self.State = {k: v.copy() for k, v in P.items()}
+        S = self.State
+
+        S["Pv"] = (P["Pv"]*windmap[1][1]).astype(np.int16)
+        S["PersonType"][:], S["PersonDir"][:] = 0, 0
+        for h in ["BoarderWaveHistory", "DeparterWaveHistory"]:
+            S[h] = (P[h] << 1) & self.historymask
+
+        # manage opening/closing of bus stop exit tiles
+        opening = (self.prevtyp == 2) & (tick % 600 == 500)
+        closing = (self.prevtyp == 4) & (tick % 600 == 1)
+        self.typ[opening], self.prevtyp[opening] = 4, 4
+        self.typ[closing], self.prevtyp[closing] = 2, 2
+        self.updated |= opening | closing
+
+        # redraw tiles told to update, or if state values suggest we should
+        changed = (P["BoarderWaveHistory"] != S["BoarderWaveHistory"]) | (P["DeparterWaveHistory"] != S["DeparterWaveHistory"])
+        self.redraw = self.updated | ((self.typ != 0) & ((P["Pv"] > 0) | changed))
+        self.updated[:] = False
+
+    def update(self, tick, windmap):
+        """Applies the update rules to all tiles, then applies update visuals to all tiles (equivalent to Window.update_tileset)."""
+        self.UpdateRules(tick, windmap)
+        self.UpdateVisuals(tick, windmap)
+
+    # ==============================================================================================================================#
+    # comparison and colouring
+
+    def mismatches(self, tileset):
+        """Lists (x, y, key) for every tile whose state differs from the equivalent Tile object, useful for checking the engine."""
+        found = []
+        for row in tileset:
+            for t in row:
+                y, x = t.y, t.x
+                if t.typ != self.typ[y, x]: found.append((x, y, "typ"))
+                if t.prevtyp != self.prevtyp[y, x]: found.append((x, y, "prevtyp"))
+                for k in KEYS:
+                    v = getattr(t.State, k)
+                    if k == "PersonDir": v = 0 if v is None else DIRCODES[v]
+                    elif k == "PersonType": v = 0 if v is None else v
+                    if v != self.State[k][y, x]: found.append((x, y, k))
+        return(found)
+
+    def colourtile(self, y, x, colours, table):
+        """function for getting tile colour based on tile type (equivalent to Tile.colourtile), shaded through the colour table."""
+        typ = int(self.typ[y, x])
+        if typ == 1:
+            return(self.shadeinred(y, x, table, x))
+        elif typ in [0, 2]:
+            return(colours[typ])
+        else:
+            if typ in [5,6,7,8,9] and self.State["Carrier"][y, x]:
+                return((255,0,0))
+            elif typ in [5,6,7,8,9] and self.State["Infection"][y, x]:
+                return((255,255,0))
+            else:
+                return(self.shadeinred(y, x, table, table.palette + typ))
+
+    def shadeinred(self, y, x, table, base):
+        """function for shading tiles by Pv (red) and the departer/boarder distancing waves (green/blue), from base colour base."""
+        S = self.State
+        return(table.colour(base, S["Pv"][y, x], history_value(int(S["DeparterWaveHistory"][y, x])), history_value(int(S["BoarderWaveHistory"][y, x]))))
+
+    def colour_array(self, table):
+        """Colours of the whole grid as a (height, width, 3) uint8 RGB array, with the same colours as colourtile (walls are black)."""
+        S = self.State
+        base = np.where(self.typ == 1, np.arange(self.width)[None, :], table.palette + self.typ.astype(np.intp))
+
+        # walls and closed exits are unshaded (index 0 of every channel), carriers are red and infected people yellow
+        unshaded = (self.typ == 0) | (self.typ == 2)
+        Pv = np.where(unshaded, 0, np.minimum(S["Pv"], 30))
+        departer = np.where(unshaded, 0, history_value_array(S["DeparterWaveHistory"]))
+        boarder = np.where(unshaded, 0, history_value_array(S["BoarderWaveHistory"]))
+        red, green, blue = table.arrays
+        rgb = np.stack([red[base, Pv], green[base, departer], blue[base, boarder]], axis=-1)
+        people = self.typ >= 5
+        rgb[people & S["Infection"]] = (255, 255, 0)
+        rgb[people & S["Carrier"]] = (255, 0, 0)
+        return(rgb)
@@ -0,0 +1,15 @@
+import random
+
+class RandomStreams():
+    """Per-simulation random number streams, so that simulations never share (or reseed) the global random module."""
+    """Each stream is its own generator seeded from the simulation seed and the stream name, so runs are reproducible."""
+    def __init__(self, seed=None):
+        """Streams: wind (integer seed for the perlin lattice hash), spawn (spawning people) and infection (infection rolls)."""
+        self.seed = random.randint(0, 10000000) if seed is None else seed
+        self.wind = self.stream("wind").getrandbits(32)
+        self.spawn = self.stream("spawn")
+        self.infection = self.stream("infection")
+
+    def stream(self, name):
+        """Makes a generator for the named stream, string seeds are hashed with sha512 so this does not depend on PYTHONHASHSEED."""
+        return(random.Random("%d:%s" % (self.seed, name)))
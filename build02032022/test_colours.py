@@ -0,0 +1,27 @@
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import pytest
+import wavespreadfullversion as wavespread
+
+def max_pv(sim):
+    """Largest Pv on the grid."""
+    if sim.engine == "grid": return(int(sim.gridengine.State["Pv"].max()))
+    return(max(t.State.Pv for t in sim.tiles[:-1]))
+
+@pytest.mark.parametrize("engine", ["tiles", "grid"])
+def test_strong_wind_frames_draw(engine):
+    """Wind side weights above 1 push Pv past 30, frames must still draw (Pv is shaded as 30)."""
+    screen = pygame.Surface((220*5, 40*5))
+    sim = wavespread.Simulation(40, 220, 5, engine=engine, screen=screen, windcoefficients=(0.5, 0.6),
+                                spawnrates={"boarder": 30, "walker": 20, "departer": 20})
+    for i in range(500):
+        sim.step()
+        if max_pv(sim) > 30: break
+    assert max_pv(sim) > 30
+
+    # draw a full frame with the strong spread on screen
+    sim.run(sim.ticksize)
+    if engine == "grid": sim.draw_gridengine()
+    else: sim.draw_tiles()
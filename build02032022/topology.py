@@ -0,0 +1,17 @@
+import functools
+
+# ==============================================================================================================================#
+# Grid topology
+# tiles are numbered in row-major order (index = y*width + x), every neighbour relation of a grid is precomputed once as one
+# flat index array per direction. -1 marks an out of bounds neighbour, so a tile list with a trailing None (the out of bounds
+# tile) can be indexed directly with the arrays.
+
+# direction offsets (dy, dx) from a tile to its neighbour
+OFFSETS = {"L":(0, -1), "R":(0, 1), "U":(-1, 0), "D":(1, 0), "UL":(-1, -1), "UR":(-1, 1), "DL":(1, -1), "DR":(1, 1)}
+
+@functools.lru_cache(maxsize=None)
+def neighbour_indices(width, height):
+    """Index of the neighbour in each direction of every tile of a width x height grid (-1 when out of bounds)."""
+    """Cached, so the arrays are shared by every tile and every simulation of the same grid size."""
+    return({d: tuple((y + dy)*width + x + dx if (-1 < y + dy < height and -1 < x + dx < width) else -1
+                     for y in range(height) for x in range(width)) for (d, (dy, dx)) in OFFSETS.items()})
@@ -1,5 +1,10 @@
-import pygame, os, time, random, math, heatmaps
+import pygame, os, time, math, heatmaps
 import perlinnoise as perlin
+from randomstreams import RandomStreams
+import numpy as np
+from gridengine import GridEngine, SpreadKernel, SPAWNRATES, BOARDER_WAVES, DEPARTER_WAVES, COUNTDOWN, ColourTable, history_value
+from phaseprofiler import PhaseProfiler
+from topology import neighbour_indices
 
 # ==============================================================================================================================#
 # Main utility functions
@@ -8,49 +13,42 @@ import perlinnoise as perlin
 def sigmoid(x):
     return(1/(1+math.exp(-x)))
 
+# utility function for merging dirty rects before a display update: duplicates are dropped, rects touching along a row are
+# joined into runs, then runs with the same horizontal span in touching rows are joined.
+def merge_rects(rects):
+    runs = []
+    for (x, y, w, h) in sorted(set(map(tuple, rects)), key=lambda r: (r[1], r[0])):
+        if runs and runs[-1][1] == y and runs[-1][3] == h and runs[-1][0] + runs[-1][2] >= x:
+            runs[-1][2] = max(runs[-1][2], x + w - runs[-1][0])
+        else:
+            runs.append([x, y, w, h])
+
+    merged, spans = [], {}
+    for (x, y, w, h) in runs:
+        rect = spans.pop((x, w, y), None)
+        if rect: rect.h += h
+        else:
+            rect = pygame.Rect(x, y, w, h)
+            merged.append(rect)
+        spans[(x, w, y + h)] = rect
+    return(merged)
+
 # utility function for generating a windmap, given a seeding value from -1 to 1.
-def set_windmap(value=0):
+# the coefficients scale how strongly the wind skews spread into the corner and side neighbours.
+def set_windmap(value=0, corner=0.2, side=0.3):
     # wind varies from left to right on a -1 to 1 scale
-    windmap = [[0.45-0.2*value, 0.45, 0.45+0.2*value],
-               [0.45-0.3*value, 0.7, 0.45+0.3*value],
-               [0.45-0.2*value, 0.45, 0.45+0.2*value]]
+    windmap = [[0.45-corner*value, 0.45, 0.45+corner*value],
+               [0.45-side*value, 0.7, 0.45+side*value],
+               [0.45-corner*value, 0.45, 0.45+corner*value]]
     return(windmap)
 
-# ==============================================================================================================================#
-# Neighbour class
-
-class Neighbours():
-    """Struct for holding tile neighbourhood (using this exclusively for lookups ensures we don't look at any tiles we shouldn't)."""
-    def __init__(self, x, y, width, height, tiles):
-        self.width = width
-        self.height = height
-
-        # store references to each possible neighbour
-        self.dirs = {}
-        self.dirs["L"] = self.refer(x-1, y, tiles)
-        self.dirs["R"] = self.refer(x+1, y, tiles)
-        self.dirs["U"] = self.refer(x, y-1, tiles)
-        self.dirs["D"] = self.refer(x, y+1, tiles)
-        self.dirs["UL"] = self.refer(x-1, y-1, tiles)
-        self.dirs["UR"] = self.refer(x+1, y-1, tiles)
-        self.dirs["DL"] = self.refer(x-1, y+1, tiles)
-        self.dirs["DR"] = self.refer(x+1, y+1, tiles)
-
-    def refer(self, tx, ty, tiles):
-        """References a neighbour if one exists, stores None otherwise."""
-        if tx > -1 and tx < self.width:
-            if ty > -1 and ty < self.height:
-                return(tiles[ty][tx])
-
-    def lookup(self, direction):
-        """Returns a neighbour if one exists, returns None otherwise."""
-        return(self.dirs[direction])
-
 # reciprocal neighbour relations (Direction from us to neighbour : Direction from neighbour to us)
 reciprocals = {"R":"L", "L":"R", "U":"D", "D":"U", "UL":"DR", "UR":"DL", "DL":"UR", "DR":"UL"}
-directions = {"R": (1, 2), "L":(1, 0), "U":(0, 1), "D":(2, 1), "UL":(0, 0), "UR":(0, 2), "DL":(2, 0), "DR":(2, 2)}
 TICKSIZE = 9
 
+# distancing wave transition and countdown tables as nested lists (faster to index one tile at a time than arrays)
+boarderwaves, departerwaves, countdown = BOARDER_WAVES.tolist(), DEPARTER_WAVES.tolist(), COUNTDOWN.tolist()
+
 def direction_preferences(ai):
     if ai == 1: return ["L", "R", "U", "D", "UL", "UR", "DL", "DR"]
     elif ai == 2: return ["L", "D", "DL", "DR", "R", "UL", "UR", "U"]
@@ -58,11 +56,51 @@ def direction_preferences(ai):
     elif ai == 4: return ["R", "UR", "DR", "U", "D", "UL", "DL", "L"]
     else: return ["L", "DL", "UL", "D", "U", "DR", "UR", "R"]
 
+# person type weights of the (boarder wave, departer wave) distancing values, shared by every tile
+# (will adjust to add more specificity to repulsion based on person type soon!)
+WEIGHTS = [(2,0), (0,2), (0,2), (0,2), (0,2)]
+
+# ==============================================================================================================================#
+# Tile state class
+
+class TileState():
+    """Fixed-field tile state (the same fields as the GridEngine state arrays), wave histories are bitmasks with bit 0 newest."""
+    __slots__ = ("Pv", "CanSpawn", "PersonDir", "PersonType", "Infection", "Carrier",
+                 "BoarderWaveType", "BoarderWaveHistory", "DeparterWaveType", "DeparterWaveHistory")
+
+    def __init__(self):
+        """By default tiles are uninhabited, quiet and able to spawn."""
+        self.Pv = 0
+        self.CanSpawn = True
+        self.PersonDir = None
+        self.PersonType = None
+        self.Infection = False
+        self.Carrier = False
+        self.BoarderWaveType = 0
+        self.BoarderWaveHistory = 0
+        self.DeparterWaveType = 0
+        self.DeparterWaveHistory = 0
+
+    def advance(self, prev, decay, mask):
+        """Overwrites this state with the carried over values of prev: Pv decays, people leave and wave histories shift by one."""
+        self.Pv = int(prev.Pv*decay)
+        self.CanSpawn = prev.CanSpawn
+        self.PersonDir = None
+        self.PersonType = None
+        self.Infection = prev.Infection
+        self.Carrier = prev.Carrier
+        self.BoarderWaveType = prev.BoarderWaveType
+        self.BoarderWaveHistory = (prev.BoarderWaveHistory << 1) & mask
+        self.DeparterWaveType = prev.DeparterWaveType
+        self.DeparterWaveHistory = (prev.DeparterWaveHistory << 1) & mask
+
 # ==============================================================================================================================#
 # Tile class
 
 class Tile():
     """Tile class: currently just a skeleton for a coloured square, but will have more importance later when tiles have infection rules."""
+    """Tiles are slotted, grid-wide settings and tables are read from the simulation (app) rather than copied onto every tile."""
+    __slots__ = ("x", "y", "index", "typ", "prevtyp", "updated", "app", "rect", "State", "PrevState")
 
     # ==============================================================================================================================#
     # initialization
@@ -74,86 +112,58 @@ class Tile():
         self.typ = typ
         self.prevtyp = self.typ
         self.updated = False
+        self.app = app
+        self.index = y*app.width + x    # row-major index into the simulation's tiles and neighbour index arrays
 
-        self.screen = app.screen
-        self.colours = app.colours
-        self.colourmap = app.colourmap
-        self.tol = app.tol
-
-        self.weights = [(2,0), (0,2), (0,2), (0,2), (0,2)] # (will adjust to add more specificity to repulsion based on person type soon!)
-        self.initialheat = [heatmaps.Base.boarding.map[y][x],
-                            heatmaps.Base.departing.map[y][x],
-                            heatmaps.Base.departing.map[y][x],
-                            heatmaps.Base.left.map[y][x],
-                            heatmaps.Base.right.map[y][x]]
-
-        self.historylength = 3
-        self.State = {"Pv":0,
-                      "CanSpawn": True,
-                      "PersonDir": None,
-                      "PersonType": None,
-                      "Infection": False,
-                      "Carrier": False,
-                      "BoarderWaveType":0,
-                      "BoarderWaveHistory":[0 for i in range(self.historylength)],
-                      "DeparterWaveType":0,
-                      "DeparterWaveHistory":[0 for i in range(self.historylength)]}
-        
-        self.PrevState = {"Pv":0,
-                          "CanSpawn": True,
-                          "PersonDir": None,
-                          "PersonType": None,
-                          "Infection": False,
-                          "Carrier": False,
-                          "BoarderWaveType":0,
-                          "BoarderWaveHistory":[0 for i in range(self.historylength)],
-                          "DeparterWaveType":0,
-                          "DeparterWaveHistory":[0 for i in range(self.historylength)]}
+        # the two states are swapped (and the new state overwritten in place) on every update
+        self.State = TileState()
+        self.PrevState = TileState()
         
-        if self.typ != 0:
+        self.rect = None
+        if self.typ != 0 and app.screen is not None:
             self.rect = pygame.Rect((self.x)*app.scale,
                                     (self.y)*app.scale,
                                     app.scale, app.scale)
-            pygame.draw.rect(self.screen, self.colourtile(self.typ), self.rect)#, 1)
+            self.draw()
+
+    def neighbour(self, direction):
+        """Returns the neighbour in the given direction if one exists, returns None otherwise."""
+        return(self.app.tiles[self.app.neighbours[direction][self.index]])
 
     # ==============================================================================================================================#
     # spread ruleset
 
-    def SpreadTiles(self, windmap=None):
+    def SpreadTiles(self, spread):
         """Algorithm for distributing spread to neighbour tiles."""
-        if self.typ in [5,6,7,8,9] and self.State["Carrier"]:
-            self.State["Pv"] = 30
+        """spread is the largest wind-weighted previous neighbour value, precomputed for the whole grid by a SpreadKernel."""
+        if self.typ in [5,6,7,8,9] and self.State.Carrier:
+            self.State.Pv = 30
         else:
             # set Pv to be largest of previous neighbour values
-            for d in ["UL", "L", "DL", "U", "D", "UR", "R", "DR"]:
-                target = self.neighbours.lookup(reciprocals[d])
-                if target:
-                    if target.PrevState["Pv"] != 0:
-                        y, x = directions[d]
-                        nv = int(target.PrevState["Pv"]*windmap[y][x])
-                        if self.State["Pv"] < nv: self.State["Pv"] = nv
+            if self.State.Pv < spread: self.State.Pv = spread
 
     def distancewave(self, zero=False):
+        S, P = self.State, self.PrevState
         if zero:
-            if self.PrevState["BoarderWaveType"] != 0 and self.PrevState["BoarderWaveType"] == self.State["BoarderWaveType"]:
-                self.State["BoarderWaveType"] = 0
-            self.State["BoarderWaveHistory"] = [0, 0, 1]
+            if P.BoarderWaveType != 0 and P.BoarderWaveType == S.BoarderWaveType:
+                S.BoarderWaveType = 0
+            S.BoarderWaveHistory = 1 << (self.app.historylength - 1)
 
-            if self.PrevState["DeparterWaveType"] != 0 and self.PrevState["DeparterWaveType"] == self.State["DeparterWaveType"]:
-                self.State["DeparterWaveType"] = 0
-            self.State["DeparterWaveHistory"] = [0, 0, 1]
+            if P.DeparterWaveType != 0 and P.DeparterWaveType == S.DeparterWaveType:
+                S.DeparterWaveType = 0
+            S.DeparterWaveHistory = 1 << (self.app.historylength - 1)
 
-            self.State["CanSpawn"] = True
+            S.CanSpawn = True
         else:
-
-            if self.State["BoarderWaveType"] > 6:
-                self.State["BoarderWaveType"] -= 1
-                if self.State["BoarderWaveType"] == 6:
-                    self.State["BoarderWaveType"] = 0
-                    self.State["DeparterWaveType"] = 5
+            # wave types above 6 count down from a person source (skipping the rest of the update), others spread by the
+            # transition tables, indexed [l][r][u][d] by the previous neighbour wave types
+            if S.BoarderWaveType > 6:
+                S.BoarderWaveType = countdown[S.BoarderWaveType]
+                if S.BoarderWaveType == 0: S.DeparterWaveType = 5
                 return()
 
-            (l, r, u, d) = (self.neighbours.lookup("L"), self.neighbours.lookup("R"), self.neighbours.lookup("U"), self.neighbours.lookup("D"))
+            tiles, neighbours, i = self.app.tiles, self.app.neighbours, self.index
+            (l, r, u, d) = (tiles[neighbours["L"][i]], tiles[neighbours["R"][i]], tiles[neighbours["U"][i]], tiles[neighbours["D"][i]])
 
             #1 = upwards travelling cell
             #2 = downwards travelling cell
@@ -161,107 +171,47 @@ class Tile():
             #4 = leftwards travelling cell
             #5 = full source cell
             #6 = lr source cell
-            (lprev, rprev, uprev, dprev) = (0 if not l else l.PrevState["BoarderWaveType"],
-                                            0 if not r else r.PrevState["BoarderWaveType"],
-                                            0 if not u else u.PrevState["BoarderWaveType"],
-                                            0 if not d else d.PrevState["BoarderWaveType"])
-            
-            if (uprev in [2, 5, 10]) and (dprev in [1, 5, 10]):
-                self.State["BoarderWaveType"] = 5
-                self.State["BoarderWaveHistory"][0] = 1
-                self.State["CanSpawn"] = False
-            elif uprev in [2, 5, 10]:
-                self.State["BoarderWaveType"] = 2
-                self.State["BoarderWaveHistory"][0] = 1
-                self.State["CanSpawn"] = False
-            elif dprev in [1, 5, 10]:
-                self.State["BoarderWaveType"] = 1
-                self.State["BoarderWaveHistory"][0] = 1
-                self.State["CanSpawn"] = False
-            else:
-                if (lprev in [1,2,3,5,6,10]) and rprev in ([1,2,4,5,6,10]):
-                    self.State["BoarderWaveType"] = 6
-                    self.State["BoarderWaveHistory"][0] = 1
-                    self.State["CanSpawn"] = False
-                elif lprev in [1,2,3,5,6,10]:
-                    self.State["BoarderWaveType"] = 3
-                    self.State["BoarderWaveHistory"][0] = 1
-                    self.State["CanSpawn"] = False
-                elif rprev in [1,2,4,5,6,10]:
-                    self.State["BoarderWaveType"] = 4
-                    self.State["BoarderWaveHistory"][0] = 1
-                    self.State["CanSpawn"] = False
-                else:
-                    if self.State["BoarderWaveType"] != 0:
-                        self.State["BoarderWaveType"] = 0
-
-
-            if self.State["DeparterWaveType"] > 6:
-                self.State["DeparterWaveType"] -= 1
-                if self.State["DeparterWaveType"] == 6:
-                    self.State["DeparterWaveType"] = 0
-                    self.State["BoarderWaveType"] = 5
+            S.BoarderWaveType = boarderwaves[0 if not l else l.PrevState.BoarderWaveType][0 if not r else r.PrevState.BoarderWaveType] \
+                                            [0 if not u else u.PrevState.BoarderWaveType][0 if not d else d.PrevState.BoarderWaveType]
+            if S.BoarderWaveType:
+                S.BoarderWaveHistory |= 1
+                S.CanSpawn = False
+
+            if S.DeparterWaveType > 6:
+                S.DeparterWaveType = countdown[S.DeparterWaveType]
+                if S.DeparterWaveType == 0: S.BoarderWaveType = 5
                 return()
 
-            #1 = upwards travelling cell
-            #2 = downwards travelling cell
-            #3 = rightwards travelling cell
-            #4 = leftwards travelling cell
-            #5 = full source cell
-            #6 = lr source cell
-            (lprev, rprev, uprev, dprev) = (0 if not l else l.PrevState["DeparterWaveType"],
-                                            0 if not r else r.PrevState["DeparterWaveType"],
-                                            0 if not u else u.PrevState["DeparterWaveType"],
-                                            0 if not d else d.PrevState["DeparterWaveType"])
-            
-            if (uprev in [2, 5, 9]) and (dprev in [1, 5, 9]):
-                self.State["DeparterWaveType"] = 5
-                self.State["DeparterWaveHistory"][0] = 1
-                self.State["CanSpawn"] = False
-            elif uprev in [2, 5, 9]:
-                self.State["DeparterWaveType"] = 2
-                self.State["DeparterWaveHistory"][0] = 1
-                self.State["CanSpawn"] = False
-            elif dprev in [1, 5, 9]:
-                self.State["DeparterWaveType"] = 1
-                self.State["DeparterWaveHistory"][0] = 1
-                self.State["CanSpawn"] = False
-            else:
-                if (lprev in [1,2,3,5,6,10]) and rprev in ([1,2,4,5,6,10]):
-                    self.State["DeparterWaveType"] = 6
-                    self.State["DeparterWaveHistory"][0] = 1
-                    self.State["CanSpawn"] = False
-                elif lprev in [1,2,3,5,6,10]:
-                    self.State["DeparterWaveType"] = 3
-                    self.State["DeparterWaveHistory"][0] = 1
-                    self.State["CanSpawn"] = False
-                elif rprev in [1,2,4,5,6,10]:
-                    self.State["DeparterWaveType"] = 4
-                    self.State["DeparterWaveHistory"][0] = 1
-                    self.State["CanSpawn"] = False
-                else:
-                    if self.State["DeparterWaveType"] != 0:
-                        self.State["DeparterWaveType"] = 0
+            S.DeparterWaveType = departerwaves[0 if not l else l.PrevState.DeparterWaveType][0 if not r else r.PrevState.DeparterWaveType] \
+                                              [0 if not u else u.PrevState.DeparterWaveType][0 if not d else d.PrevState.DeparterWaveType]
+            if S.DeparterWaveType:
+                S.DeparterWaveHistory |= 1
+                S.CanSpawn = False
 
     # ==============================================================================================================================#
     # person updating ruleset
 
     def PersonMove(self):
+        S = self.State
+        tiles, neighbours, i = self.app.tiles, self.app.neighbours, self.index
         for d in ["L", "R", "U", "D", "UL", "UR", "DL", "DR"]:
-            target = self.neighbours.lookup(d)
-            if target and target.PrevState["PersonDir"] == d:
-                self.typ = target.PrevState["PersonType"]
-                if target.PrevState["PersonType"] == 5: self.State["BoarderWaveType"] = 10
-                else: self.State["DeparterWaveType"] = 10
+            target = tiles[neighbours[d][i]]
+            if target and target.PrevState.PersonDir == d:
+                self.typ = target.PrevState.PersonType
+                if target.PrevState.PersonType == 5: S.BoarderWaveType = 10
+                else: S.DeparterWaveType = 10
                 
-                self.State["Carrier"] = target.PrevState["Carrier"]
-                self.State["Infection"] = target.PrevState["Infection"]
-                if not self.State["Infection"]:
-                    chance = random.randint(1, 100)
-                    if chance < int(self.State["Pv"]*100/30):
-                        self.State["Infection"] = True
+                S.Carrier = target.PrevState.Carrier
+                S.Infection = target.PrevState.Infection
+                if not S.Infection:
+                    stats = self.app.stats
+                    stats["peakpv"] = max(stats["peakpv"], S.Pv)
+                    chance = self.app.rng.infection.randint(1, 100)
+                    if chance < int(S.Pv*self.app.infectivity/30):
+                        S.Infection = True
+                        stats["infections"] += 1
                         
-                self.State["CanSpawn"] = False
+                S.CanSpawn = False
                 self.updated = True
                 break
 
@@ -274,6 +224,7 @@ class Tile():
             if self.prevtyp == 4:
                 self.typ = self.prevtyp
                 self.updated = True
+                self.app.stats["boarded"] += 1
                 return()
         
         elif (ai == 4 and self.x == 219) or (ai == 5 and self.x == 0):
@@ -297,99 +248,104 @@ class Tile():
                 mini = t
                 bestd = pd
 
-        if ai == 1: self.State["BoarderWaveType"] = 10
-        else: self.State["DeparterWaveType"] = 10
-        self.State["CanSpawn"] = False
+        S = self.State
+        if ai == 1: S.BoarderWaveType = 10
+        else: S.DeparterWaveType = 10
+        S.CanSpawn = False
 
         if bestd != "":
-            self.State["PersonType"] = self.typ
-            self.State["PersonDir"] = reciprocals[bestd]
+            S.PersonType = self.typ
+            S.PersonDir = reciprocals[bestd]
             self.typ = self.prevtyp
             self.updated = True
 
     def test_tile(self, d, ai):
         """Functionality for obtaining the heatmap value of a tile in the given direction of motion."""
-        target = self.neighbours.lookup(d)
+        target = self.neighbour(d)
         if target: return(target.getheat(ai))
         else: return(10000000)
 
     def getheat(self, ai):
         """function for obtaining heat value for the current tile."""
-        w1, w2 = self.weights[ai-1]
-        # value from boarder distance waves
-        v1 = (0 if not 1 in self.PrevState["BoarderWaveHistory"] else self.historylength-self.PrevState["BoarderWaveHistory"][::-1].index(1) + 1)
-        # value from other people distance waves
-        v2 = (0 if not 1 in self.PrevState["DeparterWaveHistory"] else self.historylength-self.PrevState["DeparterWaveHistory"][::-1].index(1) + 1)
-        return(self.initialheat[ai-1] + w1*v1 + w2*v2)
+        w1, w2 = WEIGHTS[ai-1]
+        # values from boarder distance waves and from other people distance waves
+        v1 = history_value(self.PrevState.BoarderWaveHistory)
+        v2 = history_value(self.PrevState.DeparterWaveHistory)
+        return(self.app.initialheat[ai-1][self.y][self.x] + w1*v1 + w2*v2)
 
     # ==============================================================================================================================#
     # person spawn ruleset
     
     def SpawnPeople(self, tick):
-        """Function for spawning people."""
+        """Function for spawning people, spawn chances are percentages taken from the simulation's spawn rates."""
+        rates = self.app.spawnrates
+        spawn = self.app.rng.spawn
         # entrance tile spawning rules
         if self.typ == 3:
             
             if self.x < 5 and self.y == 30:                     # left entrance
-                target = self.neighbours.lookup("R")
-                if target.PrevState["CanSpawn"]:
+                target = self.neighbour("R")
+                if target.PrevState.CanSpawn:
 
-                    chance = random.randint(1, 100)
-                    if chance <= 5:             # 5% chance of spawning boarder
+                    chance = spawn.randint(1, 100)
+                    if chance <= rates["boarder"]:                          # 5% chance of spawning boarder
                         self.spawn_person("R", 5)
-                    elif chance <= 7:            # 2% chance of spawning right walker
+                    elif chance <= rates["boarder"] + rates["walker"]:      # 2% chance of spawning right walker
                         self.spawn_person("R", 8)
 
             elif self.x > 215 and self.y == 30:                 # right entrance
-                target = self.neighbours.lookup("L")
-                if target.PrevState["CanSpawn"]:
+                target = self.neighbour("L")
+                if target.PrevState.CanSpawn:
 
-                    chance = random.randint(1, 100)
-                    if chance <= 5:             # 5% chance of spawning boarder
+                    chance = spawn.randint(1, 100)
+                    if chance <= rates["boarder"]:                          # 5% chance of spawning boarder
                         self.spawn_person("L", 5)
-                    elif chance <= 7:            # 2% chance of spawning left walker
+                    elif chance <= rates["boarder"] + rates["walker"]:      # 2% chance of spawning left walker
                         self.spawn_person("L", 9)
                         
             elif self.y < 0 and self.x == 25 or self.x == 195:  # upper entrances
-                target = self.neighbours.lookup("D")
-                if target.PrevState["CanSpawn"]:
+                target = self.neighbour("D")
+                if target.PrevState.CanSpawn:
 
-                    chance = random.randint(1, 100)
-                    if chance <= 5:              # 5% chance of spawning boarder
+                    chance = spawn.randint(1, 100)
+                    if chance <= rates["boarder"]:                          # 5% chance of spawning boarder
                         self.spawn_person("D", 5)
 
         # exit tile spawning rules
         if self.typ == 4:
             if self.x == 110:
-                target = self.neighbours.lookup("U")
-                if target.PrevState["CanSpawn"]:
+                target = self.neighbour("U")
+                if target.PrevState.CanSpawn:
 
-                    chance = random.randint(1, 100)
-                    if chance <= 5: # 5% chance of spawning a departer of each type
+                    chance = spawn.randint(1, 100)
+                    if chance <= rates["departer"]:                         # 5% chance of spawning a departer of each type
                         self.spawn_person("U", 6)
-                    elif chance <= 10:
+                    elif chance <= 2*rates["departer"]:
                         self.spawn_person("U", 7)
                         
             
 
     def spawn_person(self, d, typ):
-        self.State["PersonType"] = typ
-        self.State["PersonDir"] = reciprocals[d]
-        if random.randint(0, 1) == 0:
-            self.State["Infection"], self.State["Carrier"] = True, True
+        S = self.State
+        S.PersonType = typ
+        S.PersonDir = reciprocals[d]
+        if typ in [6, 7]: self.app.stats["departed"] += 1
+        if self.app.rng.spawn.randint(0, 1) == 0:
+            S.Infection, S.Carrier = True, True
         else:
-            self.State["Infection"], self.State["Carrier"] = False, False
+            S.Infection, S.Carrier = False, False
 
     # ==============================================================================================================================#
     # overall update ruleset
 
-    def UpdateRules(self, tick, windmap):
+    def UpdateRules(self, tick, windmap, spread=0):
         """Function controlling the update rules."""
-        subtick = round(tick*TICKSIZE) % TICKSIZE
+        ticksize = self.app.ticksize
+        subtick = round(tick*ticksize) % ticksize
         if self.typ != 0:
-            self.SpreadTiles(windmap)                   # pv spread
+            self.SpreadTiles(spread)                    # pv spread
             # motion frames
-            if subtick == 8:
+            if subtick == ticksize - 1:
                 self.distancewave(True)                 # zero out distancing spread
                 
                 if (self.typ == 3 or self.typ == 4) and round(tick) % 4 == 0:
@@ -410,13 +366,10 @@ class Tile():
 
     def UpdateVisuals(self, tick, windmap):
         """Routine for updating tiles. Controls the periodic arrival of buses, as well as spread of pathogens."""
-        self.PrevState = self.State
-        self.State = self.PrevState.copy()
-        
-        self.State["Pv"] = int(self.PrevState["Pv"]*windmap[1][1])
-        self.State["PersonType"], self.State["PersonDir"] = None, None
-        self.State["BoarderWaveHistory"] = ([0] + self.PrevState["BoarderWaveHistory"][:(self.historylength-1)])
-        self.State["DeparterWaveHistory"] = ([0] + self.PrevState["DeparterWaveHistory"][:(self.historylength-1)])
+        # the old previous state is reused as the new state (no per-tick allocation)
+        self.PrevState, self.State = self.State, self.PrevState
+        P, S = self.PrevState, self.State
+        S.advance(P, windmap[1][1], self.app.historymask)
 
         # manage opening/closing of bus stop exit tiles
         if self.prevtyp == 2:
@@ -424,86 +377,127 @@ class Tile():
                 self.typ = 4
                 self.prevtyp = 4
                 self.updated = True
-                pygame.draw.rect(self.screen, self.colourtile(self.typ), self.rect, 1)
+                self.draw()
         elif self.prevtyp == 4:
             if tick % 600 == 1:
                 self.typ = 2
                 self.prevtyp = 2
                 self.updated = True
-                pygame.draw.rect(self.screen, self.colourtile(self.typ), self.rect)#, 1)
+                self.draw()
 
         # update appearance if told to
         if self.updated:
-            pygame.draw.rect(self.screen, self.colourtile(self.typ), self.rect)#, 1)
+            self.draw()
             self.updated = False
 
         # or if state values suggest we should
         if self.typ != 0:
-            if self.PrevState["Pv"] > 0 or self.PrevState["BoarderWaveHistory"] != self.State["BoarderWaveHistory"] or self.PrevState["DeparterWaveHistory"] != self.State["DeparterWaveHistory"]:
-                pygame.draw.rect(self.screen, self.colourtile(self.typ), self.rect)#, 1)
-                
+            if P.Pv > 0 or P.BoarderWaveHistory != S.BoarderWaveHistory or P.DeparterWaveHistory != S.DeparterWaveHistory:
+                self.draw()
+
+    # ==============================================================================================================================#
+    # sparse updating
+
+    def quiet(self, idle, idleprev):
+        """Whether the tile holds the idle state (an air tile without Pv, waves or people, its histories only ticking with the"""
+        """zeroing), in which case it can sleep until a neighbour wakes up. The infection flags left behind by people are kept."""
+        S, P = self.State, self.PrevState
+        return(self.typ == 1 and self.prevtyp == 1 and S.Pv == 0 and P.Pv == 0 and S.CanSpawn and P.CanSpawn
+               and S.PersonDir is None and P.PersonDir is None and P.PersonType is None
+               and S.BoarderWaveType == 0 and P.BoarderWaveType == 0 and S.DeparterWaveType == 0 and P.DeparterWaveType == 0
+               and S.BoarderWaveHistory == idle.BoarderWaveHistory and P.BoarderWaveHistory == idleprev.BoarderWaveHistory
+               and S.DeparterWaveHistory == idle.DeparterWaveHistory and P.DeparterWaveHistory == idleprev.DeparterWaveHistory
+               and S.Infection == P.Infection and S.Carrier == P.Carrier)
+
+    def wake(self, idle, idleprev):
+        """Brings a sleeping tile up to date, the wave histories are the only part of the idle state that changes while asleep."""
+        self.State.BoarderWaveHistory, self.State.DeparterWaveHistory = idle.BoarderWaveHistory, idle.DeparterWaveHistory
+        self.PrevState.BoarderWaveHistory, self.PrevState.DeparterWaveHistory = idleprev.BoarderWaveHistory, idleprev.DeparterWaveHistory
+
+    def draw(self):
+        """Marks the tile to be drawn at the next render (in its colour at that time), headless simulations skip all drawing."""
+        if self.rect is not None:
+            self.app.changed.add(self.index)
+
     def colourtile(self, typ):
         """function for getting tile colour based on tile type."""
         if typ == 1:
-            return(self.shadeinred(self.colourmap[self.x]))
+            return(self.shadeinred(self.x))
         elif typ in [0, 2]:
-            return(self.colours[typ])
+            return(self.app.colours[typ])
         else:
-            if typ in [5,6,7,8,9] and self.State["Carrier"]:
+            if typ in [5,6,7,8,9] and self.State.Carrier:
                 return((255,0,0))
-            elif typ in [5,6,7,8,9] and self.State["Infection"]:
+            elif typ in [5,6,7,8,9] and self.State.Infection:
                 return((255,255,0))
             else:
-                return(self.shadeinred(self.colours[typ]))
-
-    def shadeinred(self, col):
-        """function for shading tiles, will be based on Pv, but currently displays distancing metric."""
-        (r, g, b, a) = col
+                return(self.shadeinred(self.app.colourtable.palette + typ))
 
-        Pv1 = self.State["Pv"]/30
-        Pv2 = (0 if not 1 in self.State["DeparterWaveHistory"] else self.historylength - self.State["DeparterWaveHistory"][::-1].index(1) + 1)/8
-        Pv3 = (0 if not 1 in self.State["BoarderWaveHistory"] else self.historylength - self.State["BoarderWaveHistory"][::-1].index(1) + 1)/8
-
-        n1 = int((255-r)*(1 - (1 - Pv1)**4))
-        n2 = int((255-g)*Pv2)
-        n3 = int((255-b)*Pv3)
-
-        return((r+n1,g+n2,b+n3,a))
+    def shadeinred(self, base):
+        """function for shading tiles by Pv (red) and the departer/boarder distancing waves (green/blue), looked up in the"""
+        """colour table from the index of the unshaded colour (the column's air colour, or the palette entry of the tile type)."""
+        S = self.State
+        return(self.app.colourtable.colour(base, S.Pv, history_value(S.DeparterWaveHistory), history_value(S.BoarderWaveHistory)))
 
 # ==============================================================================================================================#
-# Window class
+# Simulation class
 
-class Window():
+class Simulation():
+    """Simulation class: holds the grid, tick count and wind, and steps the model without any display, event pump or frame cap."""
 
     # ==============================================================================================================================#
     # initialization
-    
-    def __init__(self, height, width, scale):
-        """Window initialization."""
+
+    def __init__(self, height, width, scale=5, engine="tiles", seed=1256471, screen=None,
+                 ticksize=TICKSIZE, spawnrates=SPAWNRATES, infectivity=100, windcoefficients=(0.2, 0.3), historylength=3, profile=0,
+                 sparse=True):
+        """Simulation initialization. The engine is either "tiles" (one Tile object per cell) or "grid" (NumPy GridEngine)."""
+        """Tiles are only drawn if a screen surface is given. A non-zero profile logs the time spent in each rule phase every"""
+        """profile ticks. A sparse tile engine only steps the active tiles and their neighbours (the rest of the grid is quiet air,"""
+        """which a full update leaves idle). The remaining parameters are the model values varied in sweeps."""
         # attribute variables
         self.height = height
         self.width = width
         self.scale = scale
         self.tick = 0
-
-        # note that, as perlin noise sets random.seed = floor(self.perlincount + 1) every frame,
-        # all simulation randomness is actually entirely determined by the initial value below.
-        self.perlincount = 1256471#random.randint(0, 10000000) # seed randomly
-        print(f"initial seed: {self.perlincount}")  # test seeds: [4502191, 1256471]
-        self.perlin = perlin.perlin1d
+        self.engine = engine
+        self.sparse = sparse
+        self.screen = screen
+        self.dirty = []     # screen rects drawn since the last display update
+        self.changed = set()    # indices of the tiles to draw at the next render (tile engine)
+        self.drawgrid = True    # draw the grid on every update (off when a window schedules its own renders)
+
+        # model parameters: subticks per tick, spawn chances (percent), infection chance at the maximum Pv (percent) and
+        # set_windmap (corner, side) coefficients
+        self.ticksize = ticksize
+        self.spawnrates = spawnrates
+        self.infectivity = infectivity
+        self.windcoefficients = windcoefficients
+
+        # summary metrics: people infected, boarders reaching the bus, departers leaving it and the largest Pv a person was exposed to
+        self.stats = {"infections": 0, "boarded": 0, "departed": 0, "peakpv": 0}
+
+        # all simulation randomness (wind, spawning and infection streams) is entirely determined by the seed below.
+        self.rng = RandomStreams(seed)
+        self.perlincount = seed     # test seeds: [4502191, 1256471]
+        self.perlin = perlin.PerlinSchedule(self.rng.wind, 15)     # wind schedule, precomputed in blocks of perlin counts
 
         # wind
-        self.wind = set_windmap(self.perlin(self.perlincount/15))
+        self.wind = set_windmap(self.perlin(self.perlincount), *self.windcoefficients)
         self.perlincount += 1
 
         # spread tolerance value
         self.tol = 0.05
 
-        # pygame window properties
-        pygame.init()
-        self.screen = pygame.display.set_mode((self.width*self.scale, self.height*self.scale))
-        self.screen.fill("black")
-        self.clock = pygame.time.Clock()
+        # tables shared by every tile: wave history length, the bitmask keeping history registers to that length and the base
+        # heatmap of each ai
+        self.historylength = historylength
+        self.historymask = (1 << self.historylength) - 1
+        self.initialheat = [heatmaps.Base.boarding.map,
+                            heatmaps.Base.departing.map,
+                            heatmaps.Base.departing.map,
+                            heatmaps.Base.left.map,
+                            heatmaps.Base.right.map]
 
         # main grid setup
         self.grid = []
@@ -527,11 +521,15 @@ class Window():
             self.colourmap.append((n,n,n,0))
         self.colourmap = self.colourmap + (self.colourmap[::-1])
 
+        # shaded tile colours by base colour, Pv and wave history values (only needed for drawing)
+        self.colourtable = ColourTable(self.colours, self.colourmap, self.historylength) if self.screen is not None else None
+
         self.initialize_grid()
         self.generate_display()
 
-        # begin mainloop
-        self.mainloop()
+        # opt-in rule phase profiling (the rules are only wrapped in timers during a run, or for the lifetime of a window)
+        self.profiler = None
+        if profile: self.profiler = PhaseProfiler(self.phases(), profile*self.ticksize, "subticks")
 
     def initialize_grid(self):
         """Function for creating underlying tile map for the grid. Currently the sizes and locations of corridors are hard-coded."""
@@ -548,6 +546,16 @@ class Window():
 
     def generate_display(self):
         """Function for generating tile grid during initialization."""
+        if self.engine == "grid":
+            self.frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)    # last rendered frame (the screen starts black)
+            self.gridengine = GridEngine(self.grid, self.ticksize, self.historylength, rng=self.rng, spawnrates=self.spawnrates,
+                                         infectivity=self.infectivity, stats=self.stats)
+            if self.screen is not None: self.draw_gridengine()
+            return()
+
+        self.kernel = SpreadKernel(self.height, self.width)
+        self.neighbours = neighbour_indices(self.width, self.height)
+
         # generate cells
         for y in range(0, self.height):
             row = []
@@ -555,52 +563,214 @@ class Window():
                 row.append(Tile(x, y, self.grid[y][x], self))
             self.tileset.append(row)
 
-        # define cell neighbourhoods
-        for y in range(0, self.height):
-            for x in range(0, self.width):
-                tile = self.tileset[y][x]
-                tile.neighbours = Neighbours(x, y, self.width, self.height, self.tileset)
+        # tiles by row-major index, the trailing None is the out of bounds tile (index -1 of the neighbour index arrays)
+        self.tiles = [tile for row in self.tileset for tile in row] + [None]
+
+        # sparse updating: the indices of every tile's non-wall neighbours, the state pair held by idle tiles (stepped alongside
+        # the grid) and the tiles that aren't asleep (all but air and walls are always awake)
+        self.adjacent = [tuple(sorted(j for j in (self.neighbours[d][i] for d in self.neighbours) if j != -1 and self.tiles[j].typ != 0))
+                         for i in range(self.height*self.width)]
+        self.idle, self.idleprev = TileState(), TileState()
+        self.active = [i for (i, t) in enumerate(self.tiles[:-1]) if t.typ not in [0, 1]]
+        if self.screen is not None: self.draw_tiles()
+
+    def phases(self):
+        """The rule phases timed by the profiler, as (name, owner, function name), for the engine in use."""
+        owner = GridEngine if self.engine == "grid" else Tile
+        phases = [(name, owner, name) for name in ["SpreadTiles", "distancewave", "SpawnPeople", "PersonNavigation", "PersonMove", "UpdateVisuals"]]
+        if self.engine != "grid": phases.insert(0, ("SpreadKernel", SpreadKernel, "__call__"))
+        return(phases)
+
+    # ==============================================================================================================================#
+    # main functionality
+
+    def step(self):
+        """Advances the simulation by one subtick: the wind is updated first, then tile updates are propagated."""
+        # update wind
+        perlinvalue = self.perlin(self.perlincount)
+        self.wind = set_windmap((2*sigmoid(1.5*(perlinvalue)) - 1)/(sigmoid(1)-sigmoid(-1)), *self.windcoefficients)
+
+        subtick = round(self.tick*self.ticksize) % self.ticksize
+        if not subtick == self.ticksize - 1: self.perlincount += 1
+
+        # increment tick count
+        self.tick += 1/self.ticksize
+
+        # CA update
+        self.update_tileset()
+        if self.profiler is not None: self.profiler.step()
+
+    def run(self, ticks):
+        """Steps the simulation a given number of subticks as fast as possible (profiled only for the length of the run)."""
+        if self.profiler is not None: self.profiler.enable()
+        try:
+            for i in range(ticks):
+                self.step()
+        finally:
+            if self.profiler is not None: self.profiler.disable()
+        return(self)
+
+    def update_tileset(self):
+        """Update loop for all tiles on each tick."""
+        # applies update rules to all tiles, then applies update visuals to all tiles
+        tick = round(self.tick, 1)
+        if self.engine == "grid":
+            self.gridengine.update(tick, self.wind)
+            if self.screen is not None and self.drawgrid: self.draw_gridengine()
+            return()
+
+        if self.sparse:
+            self.update_active(tick)
+        else:
+            # pv spread for the whole grid at once, from the previous Pv of every tile
+            pv = np.array([[t.PrevState.Pv for t in row] for row in self.tileset], dtype=np.int16)
+            spread = self.kernel(pv, self.wind).tolist()
+
+            list(map(lambda x, s: list(map(lambda t, v: t.UpdateRules(tick, self.wind, v), x, s)), self.tileset, spread))
+            list(map(lambda x: list(map(lambda t: t.UpdateVisuals(tick, self.wind), x)), self.tileset))
+        if self.screen is not None and self.drawgrid: self.draw_tiles()
+
+    def update_active(self, tick):
+        """Sparse update loop: only the active tiles and their neighbours are stepped (in row-major order, as random streams are"""
+        """drawn in tile order). A sleeping tile with no active neighbour would stay idle, so skipping it matches a full update."""
+        tiles, idle, idleprev = self.tiles, self.idle, self.idleprev
+        stepped = set(self.active)
+        for i in self.active: stepped.update(self.adjacent[i])
+        stepped = sorted(stepped)
+
+        # sleeping tiles are brought up to date before anything reads them
+        active = set(self.active)
+        for i in stepped:
+            if i not in active: tiles[i].wake(idle, idleprev)
+
+        # pv spread, sleeping tiles hold no Pv
+        pv = np.zeros(self.height*self.width, dtype=np.int16)
+        pv[stepped] = [tiles[i].PrevState.Pv for i in stepped]
+        spread = self.kernel(pv.reshape(self.height, self.width), self.wind).ravel()[stepped].tolist()
+
+        for (i, v) in zip(stepped, spread): tiles[i].UpdateRules(tick, self.wind, v)
+        for i in stepped: tiles[i].UpdateVisuals(tick, self.wind)
+
+        # step the idle state through the same rules: zeroing on the last subtick of a tick, then decay and history shifts
+        if round(tick*self.ticksize) % self.ticksize == self.ticksize - 1:
+            idle.BoarderWaveHistory = idle.DeparterWaveHistory = 1 << (self.historylength - 1)
+        idleprev, idle = idle, idleprev
+        idle.advance(idleprev, self.wind[1][1], self.historymask)
+        self.idle, self.idleprev = idle, idleprev
+
+        self.active = [i for i in stepped if not tiles[i].quiet(idle, idleprev)]
+
+        # idle tiles are redrawn whenever their wave histories change (as they would be by UpdateVisuals)
+        if self.screen is not None and (idle.BoarderWaveHistory != idleprev.BoarderWaveHistory
+                                        or idle.DeparterWaveHistory != idleprev.DeparterWaveHistory):
+            stepped = set(stepped)
+            for (i, t) in enumerate(tiles[:-1]):
+                if t.typ == 1 and i not in stepped: t.draw()
+
+    def wake_all(self):
+        """Brings every sleeping tile up to date (for reading the whole tileset between sparse updates)."""
+        active = set(self.active)
+        for (i, t) in enumerate(self.tiles[:-1]):
+            if t.typ != 0 and i not in active: t.wake(self.idle, self.idleprev)
+
+    def draw_tiles(self):
+        """Draws every tile marked since the last render once, in its current colour (sleeping tiles are brought up to date first)."""
+        tiles, screen, dirty = self.tiles, self.screen, self.dirty
+        if self.sparse:
+            active = set(self.active)
+            for i in self.changed:
+                if i not in active: tiles[i].wake(self.idle, self.idleprev)
+
+        for i in self.changed:
+            t = tiles[i]
+            pygame.draw.rect(screen, t.colourtile(t.typ), t.rect)
+            dirty.append(t.rect)
+        self.changed.clear()
+
+    def draw_gridengine(self):
+        """Renders the grid engine as one RGB array (a pixel per tile), scaled up to the screen and blitted in one go."""
+        """Only the tiles whose colour changed since the last frame are marked dirty."""
+        rgb = self.gridengine.colour_array(self.colourtable)
+        surface = pygame.surfarray.make_surface(rgb.swapaxes(0, 1))
+        self.screen.blit(pygame.transform.scale(surface, self.screen.get_size()), (0, 0))
+
+        changed = (rgb != self.frame).any(axis=2)
+        self.frame = rgb
+        for y, x in zip(*changed.nonzero()):
+            self.dirty.append(pygame.Rect(x*self.scale, y*self.scale, self.scale, self.scale))
+
+# ==============================================================================================================================#
+# Window class
+
+class Window(Simulation):
+    """Window class: a Simulation drawn to a pygame window, the simulation rate is decoupled from the render rate."""
+
+    # ==============================================================================================================================#
+    # initialization
+
+    def __init__(self, height, width, scale, engine="tiles", seed=1256471, fps=30, speed=240, motionframes=False, profile=0):
+        """Window initialization. Frames are rendered at fps, with up to speed subticks simulated per second in between."""
+        """A speed of None simulates as many subticks as each frame's time budget allows (fast-forward),"""
+        """motionframes renders only after person move subticks (subtick 0) rather than at a fixed rate, a non-zero profile logs"""
+        """the time spent in each rule phase every profile ticks."""
+        print(f"initial seed: {seed}")
+        self.fps = fps
+        self.speed = speed
+        self.motionframes = motionframes
+
+        # pygame window properties
+        pygame.init()
+        screen = pygame.display.set_mode((width*scale, height*scale))
+        screen.fill("black")
+        self.clock = pygame.time.Clock()
+
+        super().__init__(height, width, scale, engine, seed, screen, profile=profile)
+        self.drawgrid = False
+        if self.profiler is not None: self.profiler.enable()
+
+        # show the initial grid, then begin mainloop
+        pygame.display.update()
+        self.dirty.clear()
+        self.mainloop()
 
     # ==============================================================================================================================#
     # main functionality
 
     def mainloop(self):
-        """Main loop functionality for the program. People are updated first, then tile updates are propagated."""
+        """Main loop functionality for the program. The CA is advanced for a frame's worth of subticks, then the frame is rendered."""
 
         while True:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     pygame.quit()
                     os._exit(0)
-            
-            # update wind
-            perlinvalue = self.perlin(self.perlincount/15)
-            self.wind = set_windmap((2*sigmoid(1.5*(perlinvalue)) - 1)/(sigmoid(1)-sigmoid(-1)))
-
-            subtick = round(self.tick*TICKSIZE) % TICKSIZE
-            if not subtick == 8: self.perlincount += 1
-            if subtick == 0: print(self.tick)
 
-            # increment tick count
-            self.tick += 1/TICKSIZE
+            # wind and CA updates, until the subtick quota or time budget of this frame is used up (or a motion frame is reached)
+            start = time.perf_counter()
+            steps = 0
+            while True:
+                if round(self.tick*self.ticksize) % self.ticksize == 0: print(self.tick)
+                self.step()
+                steps += 1
 
-            # CA update
-            self.update_tileset()
+                if self.motionframes:
+                    if round(round(self.tick, 1)*self.ticksize) % self.ticksize == 0: break
+                elif (self.speed is not None and steps >= self.speed/self.fps) or time.perf_counter() - start >= 1/self.fps:
+                    break
 
-            pygame.display.update()
+            self.render()
+            self.clock.tick(self.fps)
 
-            self.clock.tick(240)
-            #self.clock.tick(240)    # cap fps (8 updates every 1/30th second, so 8*30 = 240
-
-    def update_tileset(self):
-        """Update loop for all tiles on each tick."""
-        # applies update rules to all tiles, then applies update visuals to all tiles
-        tick = round(self.tick, 1)
-        list(map(lambda x: list(map(lambda t: t.UpdateRules(tick, self.wind), x)), self.tileset))
-        list(map(lambda x: list(map(lambda t: t.UpdateVisuals(tick, self.wind), x)), self.tileset))
+    def render(self):
+        """Renders a frame, only pushing the parts of the screen drawn since the last frame."""
+        if self.engine == "grid": self.draw_gridengine()
+        else: self.draw_tiles()
+        pygame.display.update(merge_rects(self.dirty))
+        self.dirty.clear()
 
 
 # ==============================================================================================================================#
 # test code
 
-Window(40, 220, 5)
+if __name__ == "__main__":
+    Window(40, 220, 5)
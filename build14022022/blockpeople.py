@@ -1,167 +1,230 @@
-import random, heatmaps
-
-class Person():
-    """Person class, handles the functionality and movement AI of simulated people."""
-    def __init__(self, x, y, app, inf, AI):
-        """People have x and y coordinates, as well as booleans indicating their despawn locations."""
-        self.x = x
-        self.y = y
-        self.col = "green"
-        self.AI = AI
-        self.infected = False
-        self.carrier = (False if random.randint(0, 100) < 50 else True)
-        
-        self.prefdirs = []
-        self.despawnsatexit = False
-        self.despawnsatentrance = False
-        self.despawned = False
-        
-        self.tiles = app.tileset
-        self.height = app.height
-        self.width = app.width
-        self.distance = app.distance
-        self.BlockPool = app.PersonPool
-
-        self.weights = [[2,0.25,0.5,0.5],[0.25,1,0.5,0.5],[0.1,0.3,0.1,0.1],[0.1,0.3,0.1,0.1]]
-        self.settile()
-        self.add_circle()
-
-    def add_circle(self):
-        """Functionality for adding the circles of influence in each heatmap for a given person."""
-        """(occurs upon spawn and at the end of movement)"""
-        for i in range(0, 4):
-            heatmaps.add_circle(self.tiles, i,
-                                self.x, self.y,
-                                self.width, self.height,
-                                self.weights[i][self.AI], self.distance)
-
-    def remove_circle(self):
-        """Functionality for removing the circles of influence in each heatmap for a given person."""
-        """(occurs at the start of movement calculations)."""
-        for i in range(0, 4):
-            heatmaps.add_circle(self.tiles, i,
-                                self.x, self.y,
-                                self.width, self.height,
-                                self.weights[i][self.AI], self.distance, True)
-
-    def despawn(self, isexit):
-        """Functionality for despawning a person."""
-        if (isexit and self.despawnsatexit) or (not isexit and self.despawnsatentrance):
-            self.tiles[self.y][self.x].removeperson()
-            self.despawned = True
-            if self.displayitem:
-                self.displayitem.despawn()
-                self.displayitem = None
-            #self.parent.canvas.delete(self.displayitem)
-        
-    def settile(self):
-        """Functionality for moving a person onto a given tile."""
-        self.tiles[self.y][self.x].addperson(self, self.col)
-
-    def removetile(self):
-        """Functionality for moving a person off of a given tile."""
-        self.tiles[self.y][self.x].removeperson()
-
-    def test_tile(self, d, tilemap):
-        """Functionality for obtaining the heatmap value of a tile in the given direction of motion."""
-        if d == "U": return (tilemap[self.y - 1][self.x].getheat(self.AI) if self.y > 0 else 10000000)
-        elif d == "D": return (tilemap[self.y + 1][self.x].getheat(self.AI) if self.y < (self.height - 1) else 10000000)
-        elif d == "R": return (tilemap[self.y][self.x + 1].getheat(self.AI) if self.x < (self.width - 1) else 10000000)
-        elif d == "L": return (tilemap[self.y][self.x - 1].getheat(self.AI) if self.x > 0 else 10000000)
-        elif d == "UR": return(tilemap[self.y - 1][self.x + 1].getheat(self.AI) if self.x < (self.width - 1) and self.y > 0 else 10000000)
-        elif d == "UL": return(tilemap[self.y - 1][self.x - 1].getheat(self.AI) if self.x > 0 and self.y > 0 else 10000000)
-        elif d == "DR": return(tilemap[self.y + 1][self.x + 1].getheat(self.AI) if self.x < (self.width - 1) and self.y < (self.height - 1) else 10000000)
-        elif d == "DL": return(tilemap[self.y + 1][self.x - 1].getheat(self.AI) if self.x > 0 and self.y < (self.height - 1) else 10000000)
-
-    def move(self):
-        """Functionality handling how people move. First, tiles are tested in decreasing preference order, subsequently, motion is made in the optimal direction."""
-        mini = self.tiles[self.y][self.x].getheat(self.AI)
-        bestd = ""
-
-        for pd in self.prefdirs:
-            t = self.test_tile(pd, self.tiles)
-            if t < mini or (t == mini and bestd == ""):
-                mini = t
-                bestd = pd
-
-        if bestd != "":
-            self.removetile()
-            if bestd == "U": self.y -= 1
-            elif bestd == "D": self.y += 1
-            elif bestd == "L": self.x -= 1
-            elif bestd == "R": self.x += 1
-            elif bestd == "UR": self.x, self.y = self.x + 1, self.y - 1
-            elif bestd == "UL": self.x, self.y = self.x - 1, self.y - 1
-            elif bestd == "DR": self.x, self.y = self.x + 1, self.y + 1
-            elif bestd == "DL": self.x, self.y = self.x - 1, self.y + 1
-            if self.displayitem: self.displayitem.move(self.x, self.y)
-            self.settile()
-
-    def infection_chance(self):
-        if random.randint(0, 100) < (self.tiles[self.y][self.x].Pv)*100:
-            self.infected = True
-            self.col = "yellow"
-            if self.displayitem: self.displayitem.recolour(self.col, self.outlines[self.col])
-
-    def update(self):
-        """Update function handles motion and sets the person to despawn at the first exit/entrance they encounter (based on AI number)."""
-        self.remove_circle()
-        self.move()
-        if not self.carrier and not self.despawned: self.infection_chance()
-        if not self.despawned: self.add_circle()
-        if not self.despawnsatexit and self.AI == 0: self.despawnsatexit = True
-        if not self.despawnsatentrance and self.AI != 0: self.despawnsatentrance = True
-            
-
-class BoardingPerson(Person):
-    """Class for people who are boarding a bus."""
-    def __init__(self, x, y, parent, inf, entrance):
-        """Movement preferences are variable depending on the spawn location relative to the bus stop."""
-        super().__init__(x, y, parent, inf, 0)
-        self.col = "blue"
-        if self.carrier: self.col = "red"
-        #self.make_displayitem()
-        # left entrance
-        if entrance == 1: self.prefdirs = ["R", "UR", "DR", "D", "U", "DL", "UL", "L"]
-        # top-left entrance
-        elif entrance == 2: self.prefdirs = ["D", "DR", "R", "UR", "U", "DL", "UL", "L"]
-        # top-right entrance
-        elif entrance == 3: self.prefdirs = ["D", "DL", "L", "UL", "U", "DR", "UR", "U"]
-        # right entrance
-        else: self.prefdirs = ["L", "UL", "DL", "D", "U", "DR", "UR", "R"]
-        self.displayitem = self.BlockPool.set_active()
-        self.outlines = {"orange" : "yellow", "yellow" : "gold", "red" : "pink", "blue" : "light blue", "green" : "light green"}
-        if self.displayitem: self.displayitem.spawn(self.x, self.y, self.col, self.outlines[self.col])
-
-
-class DepartingPerson(Person):
-    """Class for people who are getting off of a bus."""
-    def __init__(self, x, y, parent, inf):
-        """Movement preference is mostly irrelevant, so chosen to be entirely random."""
-        super().__init__(x, y, parent, inf, 1)
-        self.col = "green"
-        if self.carrier: self.col = "red"
-        #self.make_displayitem()
-        self.prefdirs = ["R", "UR", "DR", "D", "U", "DL", "UL", "L"]
-        random.shuffle(self.prefdirs)
-        while self.prefdirs[0] == "U": random.shuffle(self.prefdirs)
-        self.displayitem = self.BlockPool.set_active()
-        self.outlines = {"orange" : "yellow", "yellow" : "gold", "red" : "pink", "blue" : "light blue", "green" : "light green"}
-        if self.displayitem: self.displayitem.spawn(self.x, self.y, self.col, self.outlines[self.col])
-
-
-class LeftPerson(Person):
-    """Class for people who are moving from left to right along the main corridor."""
-    def __init__(self, x, y, parent, inf, left):
-        """Movement preference is either Left-to-Right or Right-to-Left."""
-        super().__init__(x, y, parent, inf, 2 + (0 if left else 1))
-        self.left = left
-        self.col = "orange"
-        if self.carrier: self.col = "red"
-        #self.make_displayitem()
-        if not left: self.prefdirs = ["L", "DL", "UL", "D", "U", "UR", "DR", "R"]
-        else: self.prefdirs = ["R", "UR", "DR", "D", "U", "DL", "UL", "L"]
-        self.displayitem = self.BlockPool.set_active()
-        self.outlines = {"orange" : "yellow", "yellow" : "gold", "red" : "pink", "blue" : "light blue", "green" : "light green"}
-        if self.displayitem: self.displayitem.spawn(self.x, self.y, self.col, self.outlines[self.col])
-
+import heatmaps
+import numpy as np
+
+# offsets (dx, dy) of each direction of motion
+offsets = {"U": (0, -1), "D": (0, 1), "R": (1, 0), "L": (-1, 0), "UR": (1, -1), "UL": (-1, -1), "DR": (1, 1), "DL": (-1, 1)}
+
+# circle amplitudes, WEIGHTS[n][ai] scales the circle a person of the given ai adds to heatmap n (shared by everybody)
+WEIGHTS = [[2,0.25,0.5,0.5],[0.25,1,0.5,0.5],[0.1,0.3,0.1,0.1],[0.1,0.3,0.1,0.1]]
+
+# person colours (people hold a colour code, an index into COLOURS) and the outline drawn around each colour
+COLOURS = ["blue", "green", "orange", "red", "yellow"]
+BLUE, GREEN, ORANGE, RED, YELLOW = range(0, 5)
+OUTLINES = {"orange" : "yellow", "yellow" : "gold", "red" : "pink", "blue" : "light blue", "green" : "light green"}
+
+# movement preferences of boarders by entrance (left, top-left, top-right, right) and of walkers by direction of travel
+BOARDER_PREFERENCES = {1: ["R", "UR", "DR", "D", "U", "DL", "UL", "L"],
+                       2: ["D", "DR", "R", "UR", "U", "DL", "UL", "L"],
+                       3: ["D", "DL", "L", "UL", "U", "DR", "UR", "U"],
+                       4: ["L", "UL", "DL", "D", "U", "DR", "UR", "R"]}
+WALKER_PREFERENCES = {True: ["R", "UR", "DR", "D", "U", "DL", "UL", "L"],
+                      False: ["L", "DL", "UL", "D", "U", "UR", "DR", "R"]}
+
+class Population():
+    """Population store: people are rows of column arrays (position, ai, infection and despawn flags, preference order and"""
+    """colour) rather than objects, and the whole population is stepped at once each frame. Released rows are reused."""
+    def __init__(self, app, capacity=128):
+        """The store starts with room for capacity people, and doubles whenever it fills up."""
+        self.tiles = app.tileset
+        self.width = app.width
+        self.height = app.height
+        self.distance = app.distance
+        self.rng = app.rng
+        self.stats = app.stats
+        self.BlockPool = app.PersonPool
+
+        # movement preference orders, each person holds the index of theirs (departers add their shuffled orders as they appear)
+        self.preferences = []
+        self.preferenceindex = {}
+
+        # columns, rows below size have been used and alive marks the rows currently holding a person
+        self.x = np.zeros(0, dtype=np.int16)
+        self.y = np.zeros(0, dtype=np.int16)
+        self.AI = np.zeros(0, dtype=np.int8)
+        self.carrier = np.zeros(0, dtype=bool)
+        self.infected = np.zeros(0, dtype=bool)
+        self.despawned = np.zeros(0, dtype=bool)
+        self.despawnsatexit = np.zeros(0, dtype=bool)
+        self.despawnsatentrance = np.zeros(0, dtype=bool)
+        self.prefs = np.zeros(0, dtype=np.int32)
+        self.col = np.zeros(0, dtype=np.int8)
+        self.alive = np.zeros(0, dtype=bool)
+        self.displayitems = []
+        self.size = 0
+        self.free = []
+        self.grow(capacity)
+
+    def grow(self, n):
+        """Adds room for n more people to every column."""
+        for name in ["x", "y", "AI", "carrier", "infected", "despawned", "despawnsatexit", "despawnsatentrance", "prefs", "col", "alive"]:
+            column = getattr(self, name)
+            setattr(self, name, np.concatenate([column, np.zeros(n, dtype=column.dtype)]))
+        self.displayitems.extend([None]*n)
+
+    def preference(self, prefdirs):
+        """Index of a movement preference order."""
+        key = tuple(prefdirs)
+        if key not in self.preferenceindex:
+            self.preferenceindex[key] = len(self.preferences)
+            self.preferences.append(prefdirs)
+        return(self.preferenceindex[key])
+
+    def __len__(self):
+        return(int(self.alive.sum()))
+
+    # ==============================================================================================================================#
+    # spawning
+
+    def add(self, x, y, AI):
+        """Adds a person at (x, y) with the given ai (0 = boarder, 1 = departer, 2/3 = walkers) and returns their row."""
+        """Half of all people are carriers. They are placed on their tile and their circles of influence are added."""
+        if self.free: row = self.free.pop()
+        else:
+            if self.size == len(self.alive): self.grow(len(self.alive))
+            row = self.size
+            self.size += 1
+
+        self.x[row], self.y[row], self.AI[row] = x, y, AI
+        self.carrier[row] = not self.rng.spawn.randint(0, 100) < 50
+        self.infected[row] = self.despawned[row] = self.despawnsatexit[row] = self.despawnsatentrance[row] = False
+        self.alive[row] = True
+        self.displayitems[row] = None
+
+        self.settile(row)
+        self.add_circle(row)
+        return(row)
+
+    def show(self, row, colour, prefdirs):
+        """Sets a new person's colour (red for carriers) and preferences, and gives them a block to be drawn with if one is free."""
+        self.col[row] = RED if self.carrier[row] else colour
+        self.prefs[row] = self.preference(prefdirs)
+        self.displayitems[row] = self.BlockPool.set_active()
+        if self.displayitems[row]:
+            col = COLOURS[self.col[row]]
+            self.displayitems[row].spawn(int(self.x[row]), int(self.y[row]), col, OUTLINES[col])
+
+    def BoardingPerson(self, x, y, entrance):
+        """Adds somebody boarding a bus, movement preferences depend on the spawn location relative to the bus stop."""
+        row = self.add(x, y, 0)
+        self.show(row, BLUE, BOARDER_PREFERENCES[entrance])
+        return(row)
+
+    def DepartingPerson(self, x, y):
+        """Adds somebody getting off of a bus, movement preference is mostly irrelevant, so chosen to be entirely random."""
+        row = self.add(x, y, 1)
+        self.stats["departed"] += 1
+        prefdirs = ["R", "UR", "DR", "D", "U", "DL", "UL", "L"]
+        self.rng.spawn.shuffle(prefdirs)
+        while prefdirs[0] == "U": self.rng.spawn.shuffle(prefdirs)
+        self.show(row, GREEN, prefdirs)
+        return(row)
+
+    def LeftPerson(self, x, y, left):
+        """Adds somebody walking along the main corridor, either Left-to-Right or Right-to-Left."""
+        row = self.add(x, y, 2 + (0 if left else 1))
+        self.show(row, ORANGE, WALKER_PREFERENCES[left])
+        return(row)
+
+    def retain(self, rows):
+        """Keeps the given people and frees every other row for reuse: the people who are gone (despawned, or no longer found"""
+        """on any tile since somebody else stepped onto theirs)."""
+        found = np.zeros(len(self.alive), dtype=bool)
+        found[rows] = True
+        gone = np.flatnonzero(self.alive & ~found)
+        self.alive[gone] = False
+        self.free.extend(gone.tolist())
+
+    # ==============================================================================================================================#
+    # circles of influence
+
+    def add_circle(self, row):
+        """Functionality for adding the circles of influence in each heatmap for a given person."""
+        """(occurs upon spawn and at the end of movement)"""
+        x, y, AI = int(self.x[row]), int(self.y[row]), int(self.AI[row])
+        for i in range(0, 4):
+            heatmaps.add_circle(self.tiles, i, x, y, self.width, self.height, WEIGHTS[i][AI], self.distance)
+
+    def remove_circle(self, row, x=None, y=None):
+        """Functionality for removing the circles of influence in each heatmap for a given person."""
+        """(occurs on despawn, the circles may be removed from a previous position x, y)."""
+        x, y, AI = int(self.x[row]) if x is None else x, int(self.y[row]) if y is None else y, int(self.AI[row])
+        for i in range(0, 4):
+            heatmaps.add_circle(self.tiles, i, x, y, self.width, self.height, WEIGHTS[i][AI], self.distance, True)
+
+    def move_circle(self, row, ox, oy):
+        """Functionality for moving the circles of influence in each heatmap from (ox, oy) to the current position."""
+        x, y, AI = int(self.x[row]), int(self.y[row]), int(self.AI[row])
+        for i in range(0, 4):
+            heatmaps.move_circle(self.tiles, i, ox, oy, x, y, self.width, self.height, WEIGHTS[i][AI], self.distance)
+
+    # ==============================================================================================================================#
+    # tiles and despawning
+
+    def settile(self, row):
+        """Functionality for moving a person onto their tile."""
+        self.tiles[self.y[row]][self.x[row]].addperson(row)
+
+    def despawn(self, row, isexit):
+        """Functionality for despawning a person, only once they have been allowed to despawn at this kind of tile."""
+        if (isexit and self.despawnsatexit[row]) or (not isexit and self.despawnsatentrance[row]):
+            self.tiles[self.y[row]][self.x[row]].removeperson()
+            self.despawned[row] = True
+            if isexit: self.stats["boarded"] += 1
+            if self.displayitems[row]:
+                self.displayitems[row].despawn()
+                self.displayitems[row] = None
+
+    # ==============================================================================================================================#
+    # population update
+
+    def update(self, rows):
+        """Moves the given people in order (each move shifts the circles of influence the next person navigates by), then"""
+        """sets the despawn flags of the whole group: people despawn at the first exit/entrance they reach (based on ai)."""
+        tiles, width, height, distance = self.tiles, self.width, self.height, self.distance
+        circle_values = heatmaps.circle_values
+
+        for (row, ox, oy, AI, p) in zip(rows, self.x[rows].tolist(), self.y[rows].tolist(), self.AI[rows].tolist(), self.prefs[rows].tolist()):
+            # tiles are tested in decreasing preference order, ignoring our own circle, then motion is made in the optimal direction
+            scale = WEIGHTS[AI][AI]
+            mini = tiles[oy][ox].getheat(AI, circle_values(ox, oy, ox, oy, scale, distance))
+            bestd = ""
+            for pd in self.preferences[p]:
+                dx, dy = offsets[pd]
+                tx, ty = ox + dx, oy + dy
+                if tx > -1 and tx < width and ty > -1 and ty < height: t = tiles[ty][tx].getheat(AI, circle_values(ox, oy, tx, ty, scale, distance))
+                else: t = 10000000
+                if t < mini or (t == mini and bestd == ""):
+                    mini = t
+                    bestd = pd
+
+            if bestd != "":
+                dx, dy = offsets[bestd]
+                tiles[oy][ox].removeperson()
+                self.x[row], self.y[row] = ox + dx, oy + dy
+                if self.displayitems[row]: self.displayitems[row].move(ox + dx, oy + dy)
+                self.settile(row)
+
+                # our circles stayed in place while moving, now only the changed tiles are updated
+                if self.despawned[row]: self.remove_circle(row, ox, oy)
+                else: self.move_circle(row, ox, oy)
+
+        AI = self.AI[rows]
+        self.despawnsatexit[rows] |= AI == 0
+        self.despawnsatentrance[rows] |= AI != 0
+
+    def infection_checks(self, rows):
+        """Infection checks for the given people (in order), every non-carrier still here may be infected by the Pv of their tile."""
+        rows = np.asarray(rows, dtype=np.intp)
+        rows = rows[~self.carrier[rows] & ~self.despawned[rows]]
+        if len(rows) == 0: return()
+
+        Pv = np.array([self.tiles[y][x].Pv for (x, y) in zip(self.x[rows].tolist(), self.y[rows].tolist())], dtype=np.float64)
+        self.stats["peakpv"] = max(self.stats["peakpv"], float(Pv.max()))
+        chances = np.array([self.rng.infection.randint(0, 100) for row in rows])
+        infected = rows[chances < Pv*100]
+
+        self.stats["infections"] += int((~self.infected[infected]).sum())
+        self.infected[infected] = True
+        self.col[infected] = YELLOW
+        for row in infected.tolist():
+            if self.displayitems[row]: self.displayitems[row].recolour("yellow", OUTLINES["yellow"])
@@ -1,21 +1,66 @@
+class ColourCache():
+    """Parsed colours, as 16 bit (r, g, b). Each colour is only looked up through the window (a round trip into Tk) once."""
+    def __init__(self, window):
+        self.window = window
+        self.parsed = {}
+
+    def __call__(self, col):
+        rgb = self.parsed.get(col)
+        if rgb is None: rgb = self.parsed[col] = self.window.winfo_rgb(col)
+        return(rgb)
+
+
 class BlockPool():
-    def __init__(self, n, scale, canvas):
+    """Pool of reusable canvas blocks. Free blocks are kept on a stack, so taking and returning a block are constant time."""
+    """A pool with a growth chunk creates that many more blocks at once whenever it runs dry, otherwise requests are refused."""
+    def __init__(self, n, scale, canvas, chunk=0, tag="blocks", below=None):
+        """Starts with n hidden blocks, tagged with tag. Blocks are kept beneath the items tagged below (if any) as the pool grows."""
+        self.scale = scale
+        self.canvas = canvas
+        self.chunk = chunk
+        self.tag = tag
+        self.below = below
         self.Pool = []
-        for i in range(0, n):
-            sq = Block(scale, self, canvas)
-            self.Pool.append(sq)
+
+        # counters: blocks created, blocks in use, most blocks ever in use at once and requests refused for want of a block
+        self.size = 0
+        self.inuse = 0
+        self.highwater = 0
+        self.misses = 0
+        self.grow(n)
+
+    def grow(self, n):
+        """Creates n more hidden blocks in one go."""
+        self.Pool.extend([Block(self.scale, self, self.canvas) for i in range(0, n)])
+        self.size += n
+        if self.below and n: self.canvas.tag_lower(self.tag, self.below)
 
     def set_active(self):
+        if not self.Pool and self.chunk: self.grow(self.chunk)
         if self.Pool:
-            first, self.Pool = self.Pool[0], self.Pool[1:]
-            return first
+            self.inuse += 1
+            if self.inuse > self.highwater: self.highwater = self.inuse
+            return self.Pool.pop()
         else:
+            self.misses += 1
             return None
 
     def set_inactive(self, sq):
+        self.inuse -= 1
         self.Pool.append(sq)
 
 
+class NullPool():
+    """Pool without any blocks, used when nothing is drawn (headless runs), so every request for a block is refused."""
+    size = inuse = highwater = misses = 0
+
+    def set_active(self):
+        return None
+
+    def set_inactive(self, sq):
+        pass
+
+
 class Block():
     def __init__(self, size, pool, canvas):
         self.pool = pool
@@ -27,7 +72,7 @@ class Block():
         self.scale = size
         self.visual = self.canvas.create_rectangle(0,0,0,0,
                                                    outline="", fill="black",
-                                                   state="hidden")
+                                                   state="hidden", tags=pool.tag)
     def despawn(self):
         self.canvas.itemconfigure(self.visual, state="hidden")
         self.pool.set_inactive(self)
@@ -1,3 +1,5 @@
+import functools
+
 class HeatMap():
     """Heatmap class. By default, has functionality for producing a zero heatmap."""
     def zero_map(self):
@@ -15,20 +17,67 @@ class HeatMap():
         self.map = []
 
 
+@functools.lru_cache(maxsize=None)
+def circle_stencil(radius, scale):
+    """Precomputed manhattan circle: rows (dy, x0, values), where values[i] is the amplitude at offset (x0 + i, dy) from the centre."""
+    """The centre value of 100 is added separately, on top of the centre entry of the stencil."""
+    rows = []
+    for dy in range(-radius, radius + 1):
+        span = radius - abs(dy)
+        rows.append((dy, -span, [scale*(radius - (abs(dx) + abs(dy))) for dx in range(-span, span + 1)]))
+    return(rows)
+
+def circle_values(x, y, tx, ty, scale, social_dist):
+    """The values the circle around (x, y) contributes to the tile (tx, ty)."""
+    radius = 8 if social_dist else 3
+    return(circle_contributions(tx - x, ty - y, radius, scale))
+
 def add_circle(tilemap, n, x, y, width, height, scale, social_dist, remove = False, spawnrem = False):
     """Produces a manhattan circle of either 2m or 0.75m around the given tile, the amplitude of the circle may be scaled."""
     radius = 8 if social_dist else 3
-    if remove: tilemap[y][x].increases[n].remove(100)
-    else: tilemap[y][x].increases[n].append(100)
-    for dy in range(-radius, radius + 1):
+    if remove: tilemap[y][x].decrease(n, 100)
+    else: tilemap[y][x].increase(n, 100)
+
+    # each stencil row is clipped to the grid by slicing both the tile row and the row of values
+    for (dy, x0, values) in circle_stencil(radius, scale):
         place_y = y + dy
-        dx = abs(dy) - radius
-        while dx < radius + 1 - abs(dy):
-            place_x = x + dx
-            if (place_y > -1 and place_y < height) and (place_x > -1 and place_x < width):
-                if remove: tilemap[place_y][place_x].increases[n].remove(scale*(radius - (abs(place_x - x) + abs(place_y - y))))
-                else: tilemap[place_y][place_x].increases[n].append(scale*(radius - (abs(place_x - x) + abs(place_y - y))))
-            dx += 1
+        if place_y > -1 and place_y < height:
+            start, stop = max(0, -(x + x0)), min(len(values), width - (x + x0))
+            tiles = tilemap[place_y][x + x0 + start:x + x0 + stop]
+            if remove:
+                for tile, value in zip(tiles, values[start:stop]): tile.decrease(n, value)
+            else:
+                for tile, value in zip(tiles, values[start:stop]): tile.increase(n, value)
+
+def circle_contributions(dx, dy, radius, scale):
+    """The values a circle contributes to the tile at offset (dx, dy) from its centre."""
+    d = abs(dx) + abs(dy)
+    if d == 0: return([100, scale*radius])
+    elif d <= radius: return([scale*(radius - d)])
+    else: return([])
+
+@functools.lru_cache(maxsize=None)
+def move_stencil(mx, my, radius, scale):
+    """Precomputed (dx, dy, removed, added) for every tile whose circle values change when a circle moves by (mx, my)."""
+    """Offsets are relative to the old centre, removed/added are the values taken from/given to that tile."""
+    cells = []
+    reach = radius + max(abs(mx), abs(my))
+    for dy in range(-reach, reach + 1):
+        for dx in range(-reach, reach + 1):
+            old, new = circle_contributions(dx, dy, radius, scale), circle_contributions(dx - mx, dy - my, radius, scale)
+            if old != new:
+                cells.append((dx, dy, [v for v in old if not v in new], [v for v in new if not v in old]))
+    return(cells)
+
+def move_circle(tilemap, n, ox, oy, x, y, width, height, scale, social_dist):
+    """Moves the circle around (ox, oy) to (x, y), only touching the tiles whose values change."""
+    radius = 8 if social_dist else 3
+    for (dx, dy, removed, added) in move_stencil(x - ox, y - oy, radius, scale):
+        place_x, place_y = ox + dx, oy + dy
+        if (place_y > -1 and place_y < height) and (place_x > -1 and place_x < width):
+            tile = tilemap[place_y][place_x]
+            for value in removed: tile.decrease(n, value)
+            for value in added: tile.increase(n, value)
 
 def addmaps(mapa, mapb):
     """Utility function for element-wise addition of two heatmaps of the same size."""
@@ -1,5 +1,8 @@
-import tkinter, os, time, random, math, blocks, heatmaps, functools
+import tkinter, math, blocks, raster, heatmaps
 import perlinnoise as perlin
+from randomstreams import RandomStreams
+from phaseprofiler import PhaseProfiler
+from collections import deque
 import blockpeople as people
 
 def sigmoid(x):
@@ -22,53 +25,72 @@ class Spreader():
         self.height = app.height
         self.tol = app.tol
 
+        # flat (row-major) tile list, and the neighbours of every cell as (flat index, windmap row, windmap column).
+        # neighbours are listed in the order the spread visits them, out of bounds neighbours are left out.
+        self.flat = [tile for row in self.tiles for tile in row]
+        self.neighbours = [self.neighbourhood(i % self.width, i // self.width) for i in range(0, len(self.flat))]
+
+        # generation stamps: a cell has been enqueued during the current spread iff its stamp equals the generation,
+        # so the visited set never needs clearing between spreads.
+        self.stamps = [0]*len(self.flat)
+        self.generation = 0
+
+    def neighbourhood(self, x, y):
+        """Lists the in-bounds neighbours of (x, y) with the windmap entry used to spread to each of them."""
+        cells = []
+        for (dy, dx) in [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]:
+            if x + dx > -1 and x + dx < self.width and y + dy > -1 and y + dy < self.height:
+                cells.append(((y + dy)*self.width + x + dx, dy + 1, dx + 1))
+        return(cells)
+
     def BFSSpread(self, x, y, windmap):
         """Breadth-first spreading algorithm. Spreads radially from a given x, y, based on parent windmap data."""
-        
+
         # initialize breadth first spread
-        self.Visited = []
-        self.Queue = []
-        self.tiles[y][x].Pv = 1
+        self.generation += 1
+        i = y*self.width + x
+        self.flat[i].Pv = 1
+        self.stamps[i] = self.generation
 
         # breadth first spread:
-        # while the queue is non-empty, dequeue the front element and spread to its neighbours, before logging as visited.
-        self.enqueue(x, y)
-        while len(self.Queue) > 0:
-            (y, x), self.Queue = self.Queue[0], self.Queue[1:]
-            self.spreadtiles(x, y, windmap)
-            self.Visited.append((y, x))
-
-    def enqueue(self, x, y):
-        """Enqueues a y-x tuple if the tuple is not already in the queue and has not been visited."""
-        if not (y, x) in self.Queue and not (y, x) in self.Visited:
-            self.Queue.append((y, x))
-
-    def spreadtiles(self, x, y, windmap):
-        """Algorithm for distributing spread to neighbour tiles."""
-        # applies only if the current cell has a non-zero value (values below tolerance are effectively zero)
-        if self.tiles[y][x].Pv > self.tol:
-            # a useful constant for readability.
-            Pv = self.tiles[y][x].Pv
-
-            # set the Pvs of the surrounding cells based on the windmap.
-            self.setpv(y-1, x-1, Pv*windmap[0][0])
-            self.setpv(y, x-1, Pv*windmap[1][0])
-            self.setpv(y+1, x-1, Pv*windmap[2][0])
-
-            self.setpv(y-1, x, Pv*windmap[0][1])
-            self.setpv(y+1, x, Pv*windmap[2][1])
-
-            self.setpv(y-1, x+1, Pv*windmap[0][2])
-            self.setpv(y, x+1, Pv*windmap[1][2])
-            self.setpv(y+1, x+1, Pv*windmap[2][2])
-
-    def setpv(self, ty, tx, nv):
-        """Sets the Pv of the cell at (tx, ty) to nv if the current value is < nv, then enqueues the cell."""
-        if tx > -1 and tx < self.width:
-            if ty > -1 and ty < self.height:
-                self.enqueue(tx, ty)
-                if self.tiles[ty][tx].Pv < nv:
-                    self.tiles[ty][tx].Pv = nv
+        # while the queue is non-empty, dequeue the front element and spread to its neighbours.
+        self.spread(deque([i]), windmap)
+
+    def BatchSpread(self, sources, windmap):
+        """Multi-source breadth-first spread. Spreads from every (x, y) in sources in a single sweep over the grid."""
+        """Every source is seeded with Pv 1, so the result is the combined max-propagated field of all sources."""
+
+        # initialize breadth first spread, seeding the queue with every source (in the order given)
+        self.generation += 1
+        queue = deque()
+        for (x, y) in sources:
+            i = y*self.width + x
+            self.flat[i].Pv = 1
+            if self.stamps[i] != self.generation:
+                self.stamps[i] = self.generation
+                queue.append(i)
+
+        self.spread(queue, windmap)
+
+    def spread(self, queue, windmap):
+        """Runs the breadth first spread from the (already stamped) cells in the queue until the queue empties."""
+        flat, stamps, neighbours = self.flat, self.stamps, self.neighbours
+        generation, tol = self.generation, self.tol
+
+        while queue:
+            i = queue.popleft()
+            Pv = flat[i].Pv
+
+            # applies only if the current cell has a non-zero value (values below tolerance are effectively zero)
+            if Pv > tol:
+                # set the Pvs of the surrounding cells based on the windmap, enqueueing each cell the first time it is reached.
+                for (n, wy, wx) in neighbours[i]:
+                    if stamps[n] != generation:
+                        stamps[n] = generation
+                        queue.append(n)
+                    nv = Pv*windmap[wy][wx]
+                    if flat[n].Pv < nv:
+                        flat[n].Pv = nv
 
 
 
@@ -84,7 +106,9 @@ class Tile():
                             heatmaps.Base.departing.map[y][x],
                             heatmaps.Base.left.map[y][x],
                             heatmaps.Base.right.map[y][x]]
-        self.increases = [[0], [0], [0], [0]]
+        # distancing fields as counted bins (value : number of circles contributing it), with the largest value cached
+        self.increases = [{0: 1}, {0: 1}, {0: 1}, {0: 1}]
+        self.maxincrease = [0, 0, 0, 0]
         
         self.Pv  = 0
         self.typ = typ
@@ -93,20 +117,44 @@ class Tile():
         self.tol = app.tol
         self.displayitem = None
         self.BlockPool = app.BlockPool
+        self.population = app.population
 
-        self.person = None
+        self.person = None      # population row of the person on this tile
         self.ExitOpen = False
 
-        self.window = app.window
-
-    def getheat(self, n):
-        """function for obtaining heat value for the current tile."""
-        return(round(self.initialheat[n] + max(self.increases[n]), 2))
+        self.rgb = app.rgb
+
+    def getheat(self, n, exclude=()):
+        """function for obtaining heat value for the current tile, discounting one contribution of each value in exclude."""
+        top = self.maxincrease[n]
+        if top in exclude:
+            # the largest value may belong to the excluded circle, so find the largest value with a contribution left over
+            counts = self.increases[n]
+            for value in sorted(counts, reverse=True):
+                if counts[value] > exclude.count(value):
+                    top = value
+                    break
+        return(round(self.initialheat[n] + top, 2))
+
+    def increase(self, n, value):
+        """Adds a circle contribution to distancing field n."""
+        counts = self.increases[n]
+        counts[value] = counts.get(value, 0) + 1
+        if value > self.maxincrease[n]: self.maxincrease[n] = value
+
+    def decrease(self, n, value):
+        """Removes a circle contribution from distancing field n."""
+        counts = self.increases[n]
+        if counts[value] == 1:
+            del counts[value]
+            if value == self.maxincrease[n]: self.maxincrease[n] = max(counts)
+        else:
+            counts[value] -= 1
 
     def shadeinred(self, col):
         """function for shading the current cell based on Pv value."""
         if self.Pv > 1: self.Pv = 1
-        (r, g, b) = self.window.winfo_rgb(col)
+        (r, g, b) = self.rgb(col)
         n = int((65534-r)*(1 - (1 - self.Pv)**2))
         return(("#%4.4x%4.4x%4.4x" % (r+n,g,b)))
 
@@ -118,13 +166,13 @@ class Tile():
         """Routine for (visually) removing a person from a tile."""
         self.person = None
 
-    def addperson(self, dat, colour):
+    def addperson(self, row):
         """Routine for adding a person to a tile. If this tile is an exit or entrance, the person will trigger a relevant despawn routine."""
-        self.person = dat
+        self.person = row
         if self.ExitOpen and self.typ == 2:
-            dat.despawn(True)
+            self.population.despawn(row, True)
         elif self.typ == 3:
-            dat.despawn(False)
+            self.population.despawn(row, False)
 
     def update(self, tick):
         """Routine for updating tiles. Controls the periodic arrival of buses, as well as spread of pathogens."""
@@ -136,15 +184,15 @@ class Tile():
             elif tick % 600 == 499:
                 self.colour = "green"
                 self.ExitOpen = True
-                if self.person and self.person.AI == 0:
-                    self.person.remove_circle()
-                    self.person.despawn(True)
+                if self.person is not None and self.population.AI[self.person] == 0:
+                    self.population.remove_circle(self.person)
+                    self.population.despawn(self.person, True)
                     self.person = None
 
         # update tile appearance based on Pv if needed
         if self.Pv > self.tol:
             self.Pv *= 0.7
-            if self.typ != 0 and not self.person:
+            if self.typ != 0 and self.person is None:
                 if self.displayitem:
                     self.displayitem.recolour(self.colourtile(self.typ))
                 else:
@@ -155,7 +203,7 @@ class Tile():
         else:
             if self.Pv != 0:
                 self.Pv = 0
-                if self.typ != 0 and not self.person:
+                if self.typ != 0 and self.person is None:
                     if self.displayitem:
                         self.displayitem.despawn()
                         self.displayitem = None
@@ -163,22 +211,8 @@ class Tile():
         return(self.person)
 
 
-class Window():
-    def end(self, e):
-        """Utility function for clean program window exit."""
-        self.window.destroy()
-        #os._exit(0)
-
-    # utility functions for detecting key presses/key releases.
-    def processkey(self, e):
-        if not e.keysym in self.keys:
-            self.keys.append(e.keysym)
-
-    def processrelease(self, e):
-        if e.keysym in self.keys:
-            self.keys.remove(e.keysym)
-
-
+class Simulation():
+    """Simulation class: holds the grid, people, tick count and wind, and steps the model without any window or frame delay."""
     def initialize_grid(self):
         """Function for creating underlying tile map for the grid. Currently the sizes and locations of corridors are hard-coded."""
         for y in range(0, self.height):
@@ -201,20 +235,32 @@ class Window():
 
     def updatetile(self, tile):
         person = tile.update(self.tick)
-        if person: self.peoples[person.AI].append(person)
-
-    def updateperson(self, person):
-        person.update()
-        if person.carrier: self.spreader.BFSSpread(person.x, person.y, self.wind)
+        if person is not None: self.peoples[self.population.AI[person]].append(person)
 
     def update_tileset(self):
         """Update loop for all tiles on each tick."""
-        # update people (and BFSSpread around any infected)
-        list(map(lambda x: list(map(self.updateperson, x)), self.peoples))
+        # move people (in order of ai, then position), then infection checks and spread around carriers. Movement doesn't
+        # depend on Pv, so it can all happen before any spreading.
+        people = self.population
+        rows = [row for group in self.peoples for row in group]
+        people.update(rows)
+        if self.batchspread:
+            # every infection check runs before any of this frame's spreading, so people only see the Pv left by the previous
+            # frame (already decayed), rather than the fresh spread of the carriers updated before them: infection timing and
+            # counts differ from the per-carrier spreading.
+            people.infection_checks(rows)
+            carriers = [(x, y) for (x, y, c) in zip(people.x[rows].tolist(), people.y[rows].tolist(), people.carrier[rows].tolist()) if c]
+            if carriers: self.spreader.BatchSpread(carriers, self.wind)
+        else:
+            # carriers spread one at a time, so each infection check sees the spread of the carriers before it
+            for row in rows:
+                if people.carrier[row]: self.spreader.BFSSpread(int(people.x[row]), int(people.y[row]), self.wind)
+                else: people.infection_checks([row])
 
-        # flush storage of people, update tiles and store people found.
+        # flush storage of people, update tiles and store people found (the rows of anybody not found are freed).
         self.peoples = [[],[],[],[]]             
         list(map(lambda x: list(map(self.updatetile, x)), self.tileset))
+        people.retain([row for group in self.peoples for row in group])
         
     def spawn_people(self):
         """Function for spawning new people."""        
@@ -224,24 +270,24 @@ class Window():
                 # left entrance or right entrance
                 if i == 0 or i == 3:
                     # small (20%) chance of spawning a walker
-                    if random.randint(0, 100) < 20:
-                        px, py = random.randrange(self.entrancex[2*i], self.entrancex[2*i+1]), random.randrange(self.entrancey[2*i], self.entrancey[2*i+1])
-                        if not self.tileset[py][px].person: people.LeftPerson(px, py, self, False, self.entrancex[2*i] < 10)
+                    if self.rng.spawn.randint(0, 100) < 20:
+                        px, py = self.rng.spawn.randrange(self.entrancex[2*i], self.entrancex[2*i+1]), self.rng.spawn.randrange(self.entrancey[2*i], self.entrancey[2*i+1])
+                        if self.tileset[py][px].person is None: self.population.LeftPerson(px, py, self.entrancex[2*i] < 10)
                     
                     # 50% chance of spawning a boarder
-                    elif random.randint(0, 100) < 50:
-                        px, py = random.randrange(self.entrancex[2*i], self.entrancex[2*i+1]), random.randrange(self.entrancey[2*i], self.entrancey[2*i+1])
-                        if not self.tileset[py][px].person: people.BoardingPerson(px, py, self, False, i + 1)
+                    elif self.rng.spawn.randint(0, 100) < 50:
+                        px, py = self.rng.spawn.randrange(self.entrancex[2*i], self.entrancex[2*i+1]), self.rng.spawn.randrange(self.entrancey[2*i], self.entrancey[2*i+1])
+                        if self.tileset[py][px].person is None: self.population.BoardingPerson(px, py, i + 1)
 
                 # upper entrances
                 else:
                     # 50% chance of spawning a boarder
-                    if random.randint(0, 100) < 50:
-                        px, py = random.randrange(self.entrancex[2*i], self.entrancex[2*i+1]), random.randrange(self.entrancey[2*i], self.entrancey[2*i+1])
-                        if not self.tileset[py][px].person: people.BoardingPerson(px, py, self, False, i + 1)
+                    if self.rng.spawn.randint(0, 100) < 50:
+                        px, py = self.rng.spawn.randrange(self.entrancex[2*i], self.entrancex[2*i+1]), self.rng.spawn.randrange(self.entrancey[2*i], self.entrancey[2*i+1])
+                        if self.tileset[py][px].person is None: self.population.BoardingPerson(px, py, i + 1)
 
                 # set random delay to next spawn
-                self.entrancecounts[i] = random.randint(30, 150)
+                self.entrancecounts[i] = self.rng.spawn.randint(30, 150)
                     
             else:
                 self.entrancecounts[i] -= 1
@@ -251,13 +297,13 @@ class Window():
             if self.departframe == 0:
                 if self.departers > 0:
                     # 50% chance of spawning a departer
-                    if random.randint(0, 100) < 50:
-                        px, py = random.randrange(self.entrancex[8], self.entrancex[9]), random.randrange(self.entrancey[8], self.entrancey[9])
-                        if not self.tileset[py][px].person: people.DepartingPerson(px, py, self, False)
+                    if self.rng.spawn.randint(0, 100) < 50:
+                        px, py = self.rng.spawn.randrange(self.entrancex[8], self.entrancex[9]), self.rng.spawn.randrange(self.entrancey[8], self.entrancey[9])
+                        if self.tileset[py][px].person is None: self.population.DepartingPerson(px, py)
 
                         # decrease the number of departers remaining and set a random delay.
                         self.departers -= 1
-                        self.departframe = random.randint(5, 10)
+                        self.departframe = self.rng.spawn.randint(5, 10)
                         
                         if self.departers == 0:
                             # bus may only depart after all passengers have disembarked.
@@ -268,9 +314,8 @@ class Window():
                 self.departframe -= 1
 
 
-    def mainloop(self):
-        """Main loop functionality for the program. Wind and people are updated first, then tile updates are propagated."""
-
+    def step(self):
+        """Advances the simulation by one frame. Wind and people are updated first, then tile updates are propagated."""
         # update wind
         perlinvalue = self.perlin(self.perlincount/15)
         self.wind = set_windmap((2*sigmoid(1.5*(perlinvalue)) - 1)/(sigmoid(1)-sigmoid(-1)))
@@ -283,30 +328,45 @@ class Window():
         if self.tickincrease:
             self.tick += 1
             if self.tick % 600 == 500:
-                self.departers = random.randint(3,8)
+                self.departers = self.rng.spawn.randint(3,8)
                 self.departframe = 3
                 self.tickincrease = False
-                self.canvas.itemconfigure(self.busstop, fill="green")
-            elif self.tick % 600 == 1:
-                self.canvas.itemconfigure(self.busstop, fill="red")
 
         # update tiles
         self.update_tileset()
-
-        self.window.after(30, lambda: self.mainloop())
-        
-
-    def __init__(self, height, width, scale):
-        """Window initialization."""
+        if self.profiler is not None: self.profiler.step()
+
+    def run(self, frames):
+        """Steps the simulation a given number of frames as fast as possible (profiled only for the length of the run)."""
+        if self.profiler is not None: self.profiler.enable()
+        try:
+            for i in range(frames):
+                self.step()
+        finally:
+            if self.profiler is not None: self.profiler.disable()
+        return(self)
+
+    def __init__(self, height, width, scale=5, seed=None, distance=True, canvas=None, window=None, profile=0, batchspread=False):
+        """Simulation initialization. All simulation randomness follows from the seed (chosen randomly if not given)."""
+        """batchspread opts in to spreading from every carrier in one batched sweep per frame, which is faster but changes when"""
+        """people are infected (infection checks then only see the previous frame's Pv)."""
+        """Cells and people are only drawn if a canvas is given (the window is used to parse colours while drawing)."""
+        """A non-zero profile logs the time spent in each rule phase every profile frames."""
         # attribute variables
         self.height = height
         self.width = width
         self.scale = scale
-        self.distance = True    # variable for deciding if social distancing is enabled.
+        self.canvas = canvas
+        self.window = window
+        self.rgb = blocks.ColourCache(window)  # colours parsed while drawing
+        self.rng = RandomStreams(seed)  # wind, spawning and infection random streams
+        self.distance = distance    # variable for deciding if social distancing is enabled.
+        self.batchspread = batchspread  # variable for deciding if carriers spread in one batched sweep (rather than one BFS each).
 
-        # frameskip control and initial tick
-        self.frameskip = False
-        self.fpressed = False
+        # summary metrics: people infected, boarders reaching the bus, departers leaving it and the largest Pv a person was exposed to
+        self.stats = {"infections": 0, "boarded": 0, "departed": 0, "peakpv": 0}
+
+        # initial tick
         self.tickincrease = True
         self.tick = 0
         self.departers = 0
@@ -317,25 +377,7 @@ class Window():
         # lists of entrance/exit data
         self.entrancex = [1,2,10,36,184,210,218,219,100,120]
         self.entrancey = [21,39,0,1,0,1,21,39,39,40]
-        self.entrancecounts = [random.randint(30, 150), random.randint(30, 150), random.randint(30, 150), random.randint(30, 150)]
-
-        # tk window properties
-        self.window = tkinter.Tk()
-
-        self.window.title("Grid Test")
-        self.window.resizable(False, False)
-        self.window.geometry("1200x250")
-        
-        self.keys = []
-        self.window.bind("<KeyPress>", self.processkey)
-        self.window.bind("<KeyRelease>", self.processrelease)
-        self.window.bind("<Escape>", self.end)
-
-        main           = tkinter.Frame(self.window)
-        main.pack(fill = "both", expand = 1)
-        
-        self.canvas           = tkinter.Canvas(main, bg="black")
-        self.canvas.pack(fill = "both", expand = 1)
+        self.entrancecounts = [self.rng.spawn.randint(30, 150), self.rng.spawn.randint(30, 150), self.rng.spawn.randint(30, 150), self.rng.spawn.randint(30, 150)]
 
         self.colours = ["invisible", "spec", "red", "gold"]
         self.colourmap = []
@@ -345,31 +387,26 @@ class Window():
             self.colourmap.append(("#%2.2x%2.2x%2.2x" % (n,n,n)))
         self.colourmap = self.colourmap + (self.colourmap[::-1])
 
-        for x in range(0, self.width):
-            self.canvas.create_rectangle(x*self.scale, 40*self.scale, (x+1)*self.scale,
-                                         (21 if (x < 10 or (x > 35 and x < 184) or x > 209) else 0)*self.scale,
-                                         fill=self.colourmap[x], outline="")
-        self.canvas.create_rectangle(0, 40*self.scale, self.scale, 21*self.scale, fill="gold", outline="")
-        self.canvas.create_rectangle(219*self.scale, 40*self.scale, 220*self.scale, 21*self.scale, fill="gold", outline="")
-        self.canvas.create_rectangle(10*self.scale, 0, 36*self.scale, self.scale, fill="gold", outline="")
-        self.canvas.create_rectangle(184*self.scale, 0, 210*self.scale, self.scale, fill="gold", outline="")
-        
-        self.busstop = self.canvas.create_rectangle(100*self.scale, 39*self.scale, 120*self.scale, 40*self.scale, fill="red", outline="")
-
-        # block pool, total of 1080 blocks available for the program during execution
-        self.BlockPool = blocks.BlockPool(1000, self.scale, self.canvas)
-        self.PersonPool = blocks.BlockPool(80, self.scale, self.canvas)
+        # block pools, starting with 1080 blocks and growing in chunks when busy scenes need more (none without a canvas).
+        # tile blocks are kept beneath person blocks.
+        if self.canvas is not None:
+            self.PersonPool = blocks.BlockPool(80, self.scale, self.canvas, chunk=40, tag="people")
+            self.BlockPool = blocks.BlockPool(1000, self.scale, self.canvas, chunk=250, tag="tiles", below="people")
+        else:
+            self.BlockPool = blocks.NullPool()
+            self.PersonPool = blocks.NullPool()
 
         # main grid setup
         self.grid = []
         self.tileset = []
+        self.population = people.Population(self)   # every person, stored column-wise
 
         self.initialize_grid()
         self.generate_display()
 
         # perlin noise
-        self.perlincount = random.randint(0, 10000000) # seed randomly
-        self.perlin = perlin.perlin1d
+        self.perlincount = self.rng.seed
+        self.perlin = lambda x: perlin.perlin1d(x, self.rng.wind)
 
         # wind and spreader
         self.wind = set_windmap(self.perlin(self.perlincount/15))
@@ -377,9 +414,106 @@ class Window():
 
         self.spreader = Spreader(self)
 
-        # begin mainloop
+        # opt-in rule phase profiling (the rules are only wrapped in timers during a run, or for the lifetime of a window)
+        self.profiler = None
+        if profile: self.profiler = PhaseProfiler(self.phases(), profile, "frames")
+
+    def phases(self):
+        """The rule phases timed by the profiler, as (name, owner, function name)."""
+        return([("Population.update", people.Population, "update"),
+                ("infection_checks", people.Population, "infection_checks"),
+                ("BFSSpread", Spreader, "BFSSpread"),
+                ("BatchSpread", Spreader, "BatchSpread"),
+                ("Tile.update", Tile, "update"),
+                ("add_circle", heatmaps, "add_circle"),
+                ("move_circle", heatmaps, "move_circle")])
+
+
+class Window(Simulation):
+    def end(self, e):
+        """Utility function for clean program window exit."""
+        self.window.destroy()
+        #os._exit(0)
+
+    # utility functions for detecting key presses/key releases.
+    def processkey(self, e):
+        if not e.keysym in self.keys:
+            self.keys.append(e.keysym)
+
+    def processrelease(self, e):
+        if e.keysym in self.keys:
+            self.keys.remove(e.keysym)
+
+    def mainloop(self):
+        """Main loop functionality for the program, steps the simulation and shows whether the bus stop is open."""
+        tick = self.tick
+        self.step()
+
+        if self.raster is not None:
+            self.raster.draw()
+        elif self.tick != tick:
+            if self.tick % 600 == 500:
+                self.canvas.itemconfigure(self.busstop, fill="green")
+            elif self.tick % 600 == 1:
+                self.canvas.itemconfigure(self.busstop, fill="red")
+
+        self.window.after(30, lambda: self.mainloop())
+
+    def __init__(self, height, width, scale, seed=None, profile=0, renderer="blocks"):
+        """Window initialization. All simulation randomness follows from the seed (chosen randomly if not given)."""
+        """A non-zero profile logs the time spent in each rule phase every profile frames."""
+        """The renderer draws tiles and people as canvas blocks ("blocks"), or paints the field as one image each frame ("raster")."""
+        # frameskip control
+        self.frameskip = False
+        self.fpressed = False
+
+        # tk window properties
+        self.window = tkinter.Tk()
+
+        self.window.title("Grid Test")
+        self.window.resizable(False, False)
+        self.window.geometry("1200x250")
+        
+        self.keys = []
+        self.window.bind("<KeyPress>", self.processkey)
+        self.window.bind("<KeyRelease>", self.processrelease)
+        self.window.bind("<Escape>", self.end)
+
+        main           = tkinter.Frame(self.window)
+        main.pack(fill = "both", expand = 1)
+        
+        self.canvas           = tkinter.Canvas(main, bg="black")
+        self.canvas.pack(fill = "both", expand = 1)
+
+        # the raster renderer paints everything itself, so its simulation is run without blocks or a background
+        if renderer == "raster":
+            super().__init__(height, width, scale, seed, window=self.window, profile=profile)
+            self.raster = raster.Raster(self, self.canvas, self.rgb)
+            self.raster.draw()
+        else:
+            super().__init__(height, width, scale, seed, canvas=self.canvas, window=self.window, profile=profile)
+            self.raster = None
+            self.draw_background()
+
+        # begin mainloop (profiling until the window closes)
+        if self.profiler is not None: self.profiler.enable()
         self.window.after(30, lambda: self.mainloop())
         self.window.mainloop()
 
+    def draw_background(self):
+        """Background items are tagged and lowered beneath the pooled blocks made by the simulation."""
+        for x in range(0, self.width):
+            self.canvas.create_rectangle(x*self.scale, 40*self.scale, (x+1)*self.scale,
+                                         (21 if (x < 10 or (x > 35 and x < 184) or x > 209) else 0)*self.scale,
+                                         fill=self.colourmap[x], outline="", tags="background")
+        self.canvas.create_rectangle(0, 40*self.scale, self.scale, 21*self.scale, fill="gold", outline="", tags="background")
+        self.canvas.create_rectangle(219*self.scale, 40*self.scale, 220*self.scale, 21*self.scale, fill="gold", outline="", tags="background")
+        self.canvas.create_rectangle(10*self.scale, 0, 36*self.scale, self.scale, fill="gold", outline="", tags="background")
+        self.canvas.create_rectangle(184*self.scale, 0, 210*self.scale, self.scale, fill="gold", outline="", tags="background")
+        
+        self.busstop = self.canvas.create_rectangle(100*self.scale, 39*self.scale, 120*self.scale, 40*self.scale, fill="red", outline="", tags="background")
+        self.canvas.tag_lower("background")
+
 
-Window(40, 220, 5)
+if __name__ == "__main__":
+    Window(40, 220, 5)
@@ -0,0 +1,48 @@
+import tkinter
+import numpy as np
+import blockpeople as people
+
+class Raster():
+    """Raster renderer: paints the whole field into a single PhotoImage once per frame, from a (height, width) colour array."""
+    """Stands in for the pooled canvas blocks, so a frame is one image update rather than a canvas call per tile and person."""
+    def __init__(self, app, canvas, colours):
+        """Builds the image on the canvas. colours is the parsed colour cache, so each colour name is only parsed once."""
+        self.app = app
+        self.scale = app.scale
+        self.colours = colours
+        self.image = tkinter.PhotoImage(width=app.width*app.scale, height=app.height*app.scale)
+        self.item = canvas.create_image(0, 0, image=self.image, anchor="nw")
+        self.header = b"P6 %d %d 255 " % (app.width*app.scale, app.height*app.scale)
+
+        # tiles drawn (walls are left black) and their base colours as 16 bit rgb, the bus stop exits change colour so are kept apart
+        self.tiles = [tile for row in app.tileset for tile in row]
+        self.drawn = np.array([[tile.typ != 0 for tile in row] for row in app.tileset])
+        self.base = np.array([[colours(tile.colour) if tile.typ != 0 else (0, 0, 0) for tile in row] for row in app.tileset], dtype=np.int64)
+        self.exits = [tile for tile in self.tiles if tile.typ == 2]
+
+        # person fill and outline colours by colour code, as 8 bit rgb
+        self.fills = np.array([colours(col) for col in people.COLOURS], dtype=np.int64) >> 8
+        self.outlines = np.array([colours(people.OUTLINES[col]) for col in people.COLOURS], dtype=np.int64) >> 8
+
+    def frame(self):
+        """The colour array of the field: tile base colours, shaded in red by Pv the same way as Tile.shadeinred."""
+        for tile in self.exits: self.base[tile.y, tile.x] = self.colours(tile.colour)
+        Pv = np.minimum(np.array([tile.Pv for tile in self.tiles]).reshape(self.drawn.shape), 1)
+        rgb = self.base.copy()
+        r = rgb[:, :, 0]
+        shaded = self.drawn & (Pv > 0)
+        r[shaded] += ((65534 - r[shaded])*(1 - (1 - Pv[shaded])**2)).astype(np.int64)
+        return(rgb >> 8)
+
+    def draw(self):
+        """Paints the current frame: the field scaled up to pixels, with every person present as an outlined block on top."""
+        s = self.scale
+        pixels = self.frame().astype(np.uint8).repeat(s, axis=0).repeat(s, axis=1)
+
+        population = self.app.population
+        rows = np.flatnonzero(population.alive & ~population.despawned)
+        for (x, y, col) in zip(population.x[rows].tolist(), population.y[rows].tolist(), population.col[rows].tolist()):
+            pixels[y*s:(y+1)*s, x*s:(x+1)*s] = self.outlines[col]
+            pixels[y*s+1:(y+1)*s-1, x*s+1:(x+1)*s-1] = self.fills[col]
+
+        self.image.configure(data=self.header + pixels.tobytes(), format="PPM")
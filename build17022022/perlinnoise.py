@@ -1,21 +1,28 @@
-import random
+import random, functools
 
 def smoothstep(v):
     """smoothstep function (used for lerp in perlin1d generator)"""
     if v <= 0: return(0)
     elif v >= 1: return(1)
-    else: return(6*v**5 - 15*v**4 + 10*v**3)#return(3*v**2 - 2*v**3)
-
-def perlin1d(x):
+    else: return(v*v*v*(v*(6*v - 15) + 10))#return(3*v**2 - 2*v**3)
+
+@functools.lru_cache(maxsize=4096)
+def lattice(x0, seed=0):
+    """Random value in [-101, 100] at an integer lattice point, from an integer hash of the point and seed (no reseeding of random)."""
+    h = (x0*0x9E3779B1 + seed*0x85EBCA77 + 0x27D4EB2F) & 0xFFFFFFFF
+    h = ((h ^ (h >> 16))*0x45D9F3B) & 0xFFFFFFFF
+    h = ((h ^ (h >> 16))*0x45D9F3B) & 0xFFFFFFFF
+    h = h ^ (h >> 16)
+    return(h % 202 - 101)
+
+def perlin1d(x, seed=0):
     """1D perlin noise generator (smooth random number generator, takes real number input)"""
     """Resolution of random values is 2dp (.01)."""
     x0 = int(x)
     x1 = x0 + 1
 
-    random.seed(x0)
-    v0 = random.randint(-101, 100)
-    random.seed(x0 + 1)
-    v1 = random.randint(-101, 100)
+    v0 = lattice(x0, seed)
+    v1 = lattice(x1, seed)
 
     dx = x - x0
     n0 = v0*0.01
@@ -24,6 +31,35 @@ def perlin1d(x):
     v = n0 + smoothstep(dx)*(n1 - n0)
     return(v)
 
+def perlin_range(start, stop, seed=0, scale=15):
+    """Vectorized perlin1d(count/scale) for every integer count in range(start, stop), as a NumPy array."""
+    """Uses the same operations as perlin1d, so values are identical to evaluating it one count at a time."""
+    import numpy as np      # imported here, as this build otherwise runs without NumPy
+    x = np.arange(start, stop)/scale
+    x0 = np.trunc(x).astype(np.int64)
+    lo, hi = int(x0.min()), int(x0.max()) + 1
+    values = np.array([lattice(i, seed) for i in range(lo, hi + 1)], dtype=np.float64)*0.01
+
+    n0, n1 = values[x0 - lo], values[x0 - lo + 1]
+    v = np.clip(x - x0, 0, 1)
+    return(n0 + v*v*v*(v*(6*v - 15) + 10)*(n1 - n0))
+
+class PerlinSchedule():
+    """Wind schedule: perlin1d(count/scale) for consecutive integer counts, precomputed a block of counts at a time."""
+    def __init__(self, seed=0, scale=15, block=4096):
+        self.seed = seed
+        self.scale = scale
+        self.block = block
+        self.start = 0
+        self.values = []
+
+    def __call__(self, count):
+        """Value of the schedule at the given count, a new block is generated whenever count leaves the current one."""
+        if not (self.start <= count < self.start + len(self.values)):
+            self.start = count
+            self.values = perlin_range(count, count + self.block, self.seed, self.scale).tolist()
+        return(self.values[count - self.start])
+
 ## ====================== test code below ====================== ##
 # test code displays two perlin noise generated curves
 # the curve with red peaks is an unedited 1D perlin noise plot
@@ -0,0 +1,76 @@
+import time
+
+class PhaseProfiler():
+    """Opt-in phase profiler: counts calls and cumulative (exclusive) time of named rule phases, reported as a periodic log line."""
+    """Only while enabled is each phase function swapped for a timed wrapper on its class or module, so disabled it costs nothing."""
+    """The wrappers are process wide, so only one profiler is enabled at a time (enabling another disables it first)."""
+    active = None
+
+    def __init__(self, phases, interval, unit="ticks"):
+        """phases: list of (name, owner, function name) with the owner a class or module, interval: steps between log lines."""
+        self.phases = phases
+        self.interval = interval
+        self.unit = unit
+        self.originals = []
+        self.nested = [0.0]     # time spent in nested phases, per level of the phase call stack
+        self.seconds = {name: 0.0 for (name, owner, attr) in phases}
+        self.calls = {name: 0 for (name, owner, attr) in phases}
+        self.reset()
+
+    def reset(self):
+        """Starts a new reporting interval (the counters are cleared in place, as the wrappers hold on to them)."""
+        for name in self.seconds:
+            self.seconds[name] = 0.0
+            self.calls[name] = 0
+        self.steps = 0
+        self.start = time.perf_counter()
+
+    def wrap(self, name, func):
+        """A timed version of func, counted towards the named phase (a time is only counted once, towards its innermost phase)."""
+        seconds, calls, nested, clock = self.seconds, self.calls, self.nested, time.perf_counter
+        def timed(*args, **kwargs):
+            nested.append(0.0)
+            start = clock()
+            try:
+                return(func(*args, **kwargs))
+            finally:
+                elapsed = clock() - start
+                seconds[name] += elapsed - nested.pop()
+                nested[-1] += elapsed
+                calls[name] += 1
+        return(timed)
+
+    def enable(self):
+        """Swaps every phase function for its timed wrapper (profiling every simulation in this process until disabled)."""
+        if self.originals: return(self)
+        if PhaseProfiler.active is not None: PhaseProfiler.active.disable()
+        PhaseProfiler.active = self
+        self.reset()
+        for (name, owner, attr) in self.phases:
+            func = getattr(owner, attr)
+            self.originals.append((owner, attr, func))
+            setattr(owner, attr, self.wrap(name, func))
+        return(self)
+
+    def disable(self):
+        """Puts the original phase functions back."""
+        for (owner, attr, func) in reversed(self.originals):
+            setattr(owner, attr, func)
+        self.originals = []
+        if PhaseProfiler.active is self: PhaseProfiler.active = None
+
+    def step(self):
+        """Called once per simulation step, logs (and restarts) the timings at the end of every interval while enabled."""
+        if not self.originals: return()
+        self.steps += 1
+        if self.steps >= self.interval:
+            print(self.report())
+            self.reset()
+
+    def report(self):
+        """One line summary of the interval: per phase, milliseconds per step, share of the interval's wall time and call count."""
+        elapsed = time.perf_counter() - self.start
+        steps = max(self.steps, 1)
+        phases = " | ".join(f"{name} {1000*self.seconds[name]/steps:.2f} ms {self.seconds[name]/elapsed:.0%} ({self.calls[name]} calls)"
+                            for name in self.seconds)
+        return(f"profile: {self.steps} {self.unit} in {elapsed:.2f} s | {phases}")
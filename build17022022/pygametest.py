@@ -1,5 +1,7 @@
-import pygame, os, time, random, math, heatmaps
+import pygame, os, math, itertools, heatmaps
 import perlinnoise as perlin
+from randomstreams import RandomStreams
+from topology import neighbour_indices
 
 # ==============================================================================================================================#
 # Main utility functions
@@ -8,6 +10,26 @@ import perlinnoise as perlin
 def sigmoid(x):
     return(1/(1+math.exp(-x)))
 
+# utility function for merging dirty rects before a display update: duplicates are dropped, rects touching along a row are
+# joined into runs, then runs with the same horizontal span in touching rows are joined.
+def merge_rects(rects):
+    runs = []
+    for (x, y, w, h) in sorted(set(map(tuple, rects)), key=lambda r: (r[1], r[0])):
+        if runs and runs[-1][1] == y and runs[-1][3] == h and runs[-1][0] + runs[-1][2] >= x:
+            runs[-1][2] = max(runs[-1][2], x + w - runs[-1][0])
+        else:
+            runs.append([x, y, w, h])
+
+    merged, spans = [], {}
+    for (x, y, w, h) in runs:
+        rect = spans.pop((x, w, y), None)
+        if rect: rect.h += h
+        else:
+            rect = pygame.Rect(x, y, w, h)
+            merged.append(rect)
+        spans[(x, w, y + h)] = rect
+    return(merged)
+
 # utility function for generating a windmap, given a seeding value from -1 to 1.
 def set_windmap(value=0):
     # wind varies from left to right on a -1 to 1 scale
@@ -16,36 +38,6 @@ def set_windmap(value=0):
                [0.45-0.1*value, 0.45, 0.45+0.1*value]]
     return(windmap)
 
-# ==============================================================================================================================#
-# Neighbour class
-
-class Neighbours():
-    """Struct for holding tile neighbourhood (using this exclusively for lookups ensures we don't look at any tiles we shouldn't)."""
-    def __init__(self, x, y, width, height, tiles):
-        self.width = width
-        self.height = height
-
-        # store references to each possible neighbour
-        self.L = self.refer(x-1, y, tiles)
-        self.R = self.refer(x+1, y, tiles)
-        self.U = self.refer(x, y-1, tiles)
-        self.D = self.refer(x, y+1, tiles)
-        self.UL = self.refer(x-1, y-1, tiles)
-        self.UR = self.refer(x+1, y-1, tiles)
-        self.DL = self.refer(x-1, y+1, tiles)
-        self.DR = self.refer(x+1, y+1, tiles)
-
-    def refer(self, tx, ty, tiles):
-        """References a neighbour if one exists, stores None otherwise."""
-        if tx > -1 and tx < self.width:
-            if ty > -1 and ty < self.height:
-                return(tiles[ty][tx])
-
-    def lookup(self, direction):
-        """Returns a neighbour if one exists, returns None otherwise."""
-        return(getattr(self, direction, None))
-
-
 # ==============================================================================================================================#
 # Tile class
 
@@ -65,13 +57,19 @@ class Tile():
         
         self.preferences = None
         self.id = None
+        self.ids = app.personids
 
         self.screen = app.screen
+        self.dirty = app.dirty
         self.colours = app.colours
         self.colourmap = app.colourmap
         
         self.tiles = app.tileset
+        self.index = y*app.width + x    # row-major index into the simulation's tiles and neighbour index arrays
+        self.cells = app.tiles
+        self.neighbours = app.neighbours
         self.tol = app.tol
+        self.rng = app.rng
         self.width = app.width
         self.height = app.height
 
@@ -81,14 +79,20 @@ class Tile():
                             heatmaps.Base.left.map[y][x],
                             heatmaps.Base.right.map[y][x]]
 
-        self.State = [0, {}]
-        self.PrevState = [0, {}]
+        # states hold the Pv and a distancing record of the two largest values left by people: [Pv, best value, owner of the best
+        # value, second best value (the largest left by anybody but the owner)], with -1 standing for no value
+        self.State = [0, -1, None, -1]
+        self.PrevState = [0, -1, None, -1]
         
         if self.typ != 0:
             self.rect = pygame.Rect((self.x)*app.scale,
                                     (self.y)*app.scale,
                                     app.scale, app.scale)
-            pygame.draw.rect(self.screen, self.colourtile(self.typ), self.rect)#, 1)
+            self.draw()
+
+    def neighbour(self, direction):
+        """Returns the neighbour in the given direction if one exists, returns None otherwise."""
+        return(self.cells[self.neighbours[direction][self.index]])
 
     # ==============================================================================================================================#
     # spread ruleset
@@ -103,41 +107,44 @@ class Tile():
                 Pv = self.PrevState[i]
 
                 # set the Pvs of the surrounding cells based on the windmap.
-                self.setv("UL", Pv*windmap[0][0], i)
-                self.setv("L", Pv*windmap[1][0], i)
-                self.setv("DL", Pv*windmap[2][0], i)
+                self.setv("UL", Pv*windmap[0][0])
+                self.setv("L", Pv*windmap[1][0])
+                self.setv("DL", Pv*windmap[2][0])
 
-                self.setv("U", Pv*windmap[0][1], i)
-                self.setv("D", Pv*windmap[2][1], i)
+                self.setv("U", Pv*windmap[0][1])
+                self.setv("D", Pv*windmap[2][1])
 
-                self.setv("UR", Pv*windmap[0][2], i)
-                self.setv("R", Pv*windmap[1][2], i)
-                self.setv("DR", Pv*windmap[2][2], i)
+                self.setv("UR", Pv*windmap[0][2])
+                self.setv("R", Pv*windmap[1][2])
+                self.setv("DR", Pv*windmap[2][2])
         else:
-            for key in self.PrevState[i]:
-                if self.PrevState[i][key] > 0:
-                    # a useful constant for readability.
-                    Pv = self.PrevState[i][key]
-
-                    # set the Pvs of the surrounding cells, distancing is propagated purely in cardinal directions.
-                    self.setv("L", Pv-1, i, key)
-                    self.setv("R", Pv-1, i, key)
-                    self.setv("U", Pv-1, i, key)
-                    self.setv("D", Pv-1, i, key)
-
-    def setv(self, d, nv, i, key=None):
+            # applies only if somebody left a non-zero value here
+            best, owner, second = self.PrevState[1:]
+            if best > 0:
+                # distancing is propagated purely in cardinal directions, both values falling by one (values of 0 stop spreading).
+                second = second - 1 if second > 0 else -1
+                for d in ["L", "R", "U", "D"]:
+                    target = self.cells[self.neighbours[d][self.index]]
+                    if target: target.setdistance(best - 1, owner, second)
+
+    def setv(self, d, nv):
         """Sets the Pv of the target cell at (tx, ty) to nv if the current value is < nv."""
-        target = self.neighbours.lookup(d)
+        target = self.cells[self.neighbours[d][self.index]]
         if target:
-            if i == 0:
-                if target.State[i] <= nv:
-                    target.State[i] = nv
-            else:
-                if key in target.State[i]:
-                    if target.State[i][key] <= nv:
-                        target.State[i][key] = nv
-                else:
-                    target.State[i][key] = nv
+            if target.State[0] <= nv:
+                target.State[0] = nv
+
+    def setdistance(self, value, owner, second=-1):
+        """Merges a distancing value left by owner (and a second value left by anybody else) into the current distancing record."""
+        S = self.State
+        if owner == S[2]:
+            if value > S[1]: S[1] = value
+            if second > S[3]: S[3] = second
+        elif value > S[1]:
+            # the previous best value was left by somebody else, so is at least the new second best
+            S[1], S[2], S[3] = value, owner, max(S[1], second)
+        else:
+            S[3] = max(S[3], value)
 
     # ==============================================================================================================================#
     # person updating ruleset
@@ -148,7 +155,7 @@ class Tile():
 
         # generate spread
         self.State[0] = 1
-        self.State[1][self.id] = 8
+        self.setdistance(8, self.id)
         
         # despawn rules
         if fullmove:
@@ -183,10 +190,10 @@ class Tile():
                     bestd = pd
 
             if bestd != "":
-                target = self.neighbours.lookup(bestd)
+                target = self.neighbour(bestd)
 
                 target.State[0] = 1
-                target.State[1][self.id] = 8  
+                target.setdistance(8, self.id)
 
                 if fullmove:
                     target.prevtyp = target.typ
@@ -202,24 +209,20 @@ class Tile():
                     target.updated, self.updated = True, True             
                 
             else:
-                self.State[1][self.id] = 8
+                self.setdistance(8, self.id)
                 self.State[0] = 1
 
     def test_tile(self, d, tilemap, idx, ai):
         """Functionality for obtaining the heatmap value of a tile in the given direction of motion."""
-        target = self.neighbours.lookup(d)
+        target = self.neighbour(d)
         if target: return(target.getheat(ai, idx))
         else: return(10000000)
 
     def getheat(self, ai, idx):
-        """function for obtaining heat value for the current tile."""
-        myid = None
-        distancing_value = 0
-        
-        if idx in self.PrevState[1]: myid = self.PrevState[1].pop(idx)
-        if len(self.PrevState[1]) > 0: distancing_value = (self.weights[ai-1])*max(self.PrevState[1].values())
-
-        if myid: self.PrevState[1][idx] = myid
+        """function for obtaining heat value for the current tile, the distancing value is the largest left by anybody but idx."""
+        P = self.PrevState
+        value = P[3] if P[2] == idx else P[1]
+        distancing_value = (self.weights[ai-1])*value if value >= 0 else 0
 
         return(self.initialheat[ai-1] + distancing_value)
 
@@ -232,36 +235,36 @@ class Tile():
         if self.typ == 3:
             
             if self.x < 5 and self.y == 30:                     # left entrance
-                target = self.neighbours.lookup("R")
+                target = self.neighbour("R")
                 if target.typ == 1:
                     prefs = ["R", "UR", "DR", "D", "U", "DL", "UL", "L"]
                     
-                    if random.randint(0, 100) < 10:             # 10% chance of spawning boarder
+                    if self.rng.spawn.randint(0, 100) < 10:             # 10% chance of spawning boarder
                         self.spawn_person(target, tick, 5, prefs)
-                    elif random.randint(0, 100) < 0:            # 2% chance of spawning right walker
+                    elif self.rng.spawn.randint(0, 100) < 0:            # 2% chance of spawning right walker
                         self.spawn_person(target, tick, 7, prefs)
 
             elif self.x > 215 and self.y == 30:                 # right entrance
-                target = self.neighbours.lookup("L")
+                target = self.neighbour("L")
                 if target.typ == 1:
                     prefs = ["L", "UL", "DL", "D", "U", "DR", "UR", "R"]
                     
-                    if random.randint(0, 100) < 10:             # 10% chance of spawning boarder
+                    if self.rng.spawn.randint(0, 100) < 10:             # 10% chance of spawning boarder
                         self.spawn_person(target, tick, 5, prefs)
-                    elif random.randint(0, 100) < 0:            # 2% chance of spawning left walker
+                    elif self.rng.spawn.randint(0, 100) < 0:            # 2% chance of spawning left walker
                         self.spawn_person(target, tick, 8, prefs)
                         
             elif self.y < 0 and self.x == 25 or self.x == 195:  # upper entrances
-                target = self.neighbours.lookup("D")
+                target = self.neighbour("D")
                 if target.typ == 1:
-                    if random.randint(0, 100) < 5:              # 5% chance of spawning boarder
+                    if self.rng.spawn.randint(0, 100) < 5:              # 5% chance of spawning boarder
                         if self.x > 110: prefs = ["D", "DL", "L", "UL", "U", "DR", "UR", "R"]
                         else: prefs = ["D", "DR", "R", "UR", "U", "DL", "UL", "L"]
                         
                         self.spawn_person(target, tick, 5, prefs)
 
     def spawn_person(self, target, tick, typ, prefs):
-        target.typ, target.id, target.preferences, target.updated = typ, f'f{tick}x{self.x}y{self.y}t{typ}', prefs, True
+        target.typ, target.id, target.preferences, target.updated = typ, next(self.ids), prefs, True
 
     # ==============================================================================================================================#
     # overall update ruleset
@@ -289,15 +292,13 @@ class Tile():
     def UpdateVisuals(self, tick, windmap):
         """Routine for updating tiles. Controls the periodic arrival of buses, as well as spread of pathogens."""
         if self.typ != 0:
-            # propagate cell decay
-            self.PrevState = self.State
+            # propagate cell decay (the old previous state is reused as the new state), distancing values of 1 or less are dropped
+            self.PrevState, self.State = self.State, self.PrevState
+            P, S = self.PrevState, self.State
+            S[0] = P[0]*windmap[1][1]
 
-            self.State = [0, {}]
-            self.State[0] = self.PrevState[0]*windmap[1][1]
-
-            for key in self.PrevState[1]:
-                if self.PrevState[1][key] > 1:
-                    self.State[1][key] = self.PrevState[1][key] - 1
+            if P[1] > 1: S[1], S[2], S[3] = P[1] - 1, P[2], (P[3] - 1 if P[3] > 1 else -1)
+            else: S[1], S[2], S[3] = -1, None, -1
 
         # manage opening/closing of bus stop exit tiles
         if self.prevtyp == 2:
@@ -307,7 +308,7 @@ class Tile():
                 self.id = None
                 self.preferences = None
                 self.updated = True
-                pygame.draw.rect(self.screen, self.colourtile(self.typ), self.rect, 1)
+                self.draw(1)
         elif self.prevtyp == 4:
             if tick % 600 == 1:
                 self.typ = 2
@@ -315,18 +316,24 @@ class Tile():
                 self.id = None
                 self.preferences = None
                 self.updated = True
-                pygame.draw.rect(self.screen, self.colourtile(self.typ), self.rect)#, 1)
+                self.draw()
 
         # update appearance if told to
         if self.updated:
-            pygame.draw.rect(self.screen, self.colourtile(self.typ), self.rect)#, 1)
+            self.draw()
             self.updated = False
 
         # or if state values suggest we should
         if self.typ != 0:
-            if not self.PrevState[1] == {}:
-                pygame.draw.rect(self.screen, self.colourtile(self.typ), self.rect)#, 1)
-                
+            if self.PrevState[1] >= 0:
+                self.draw()
+
+    def draw(self, width=0):
+        """Draws the tile onto the screen, headless simulations (no screen) skip all drawing."""
+        if self.screen is not None:
+            pygame.draw.rect(self.screen, self.colourtile(self.typ), self.rect, width)
+            self.dirty.append(self.rect)
+
     def colourtile(self, typ):
         """function for getting tile colour based on tile type."""
         if typ == 1:
@@ -338,34 +345,37 @@ class Tile():
 
     def shadeinred(self, col):
         """function for shading tiles, will be based on Pv, but currently displays distancing metric."""
-        if self.State[1] == {}: Pv = 0
-        elif max(self.State[1].values()) > 8: Pv = 1
-        else: Pv = max(self.State[1].values())/8
+        if self.State[1] < 0: Pv = 0
+        elif self.State[1] > 8: Pv = 1
+        else: Pv = self.State[1]/8
         (r, g, b, a) = col
         n = int((255-r)*(1 - (1 - Pv)**2))
         return((r+n,g,b,a))
 
 # ==============================================================================================================================#
-# Window class
+# Simulation class
 
-class Window():
+class Simulation():
+    """Simulation class: holds the grid, tick count and wind, and steps the model without any display, event pump or frame cap."""
 
     # ==============================================================================================================================#
     # initialization
-    
-    def __init__(self, height, width, scale):
-        """Window initialization."""
+
+    def __init__(self, height, width, scale=5, seed=1256471, screen=None):
+        """Simulation initialization. Tiles are only drawn if a screen surface is given."""
         # attribute variables
         self.height = height
         self.width = width
         self.scale = scale
         self.tick = 0
+        self.screen = screen
+        self.dirty = []     # screen rects drawn since the last display update
+        self.personids = itertools.count(1)    # integer ids of spawned people
 
-        # note that, as perlin noise sets random.seed = floor(self.perlincount + 1) every frame,
-        # all simulation randomness is actually entirely determined by the initial value below.
-        self.perlincount = 1256471#random.randint(0, 10000000) # seed randomly
-        print(f"initial seed: {self.perlincount}")  # test seeds: [4502191, 1256471]
-        self.perlin = perlin.perlin1d
+        # all simulation randomness (wind and spawning streams) is entirely determined by the seed below.
+        self.rng = RandomStreams(seed)
+        self.perlincount = seed     # test seeds: [4502191, 1256471]
+        self.perlin = lambda x: perlin.perlin1d(x, self.rng.wind)
 
         # wind
         self.wind = set_windmap(self.perlin(self.perlincount/15))
@@ -374,12 +384,6 @@ class Window():
         # spread tolerance value
         self.tol = 0.05
 
-        # pygame window properties
-        pygame.init()
-        self.screen = pygame.display.set_mode((self.width*self.scale, self.height*self.scale))
-        self.screen.fill("black")
-        self.clock = pygame.time.Clock()
-
         # main grid setup
         self.grid = []
         self.tileset = []
@@ -405,9 +409,6 @@ class Window():
         self.initialize_grid()
         self.generate_display()
 
-        # begin mainloop
-        self.mainloop()
-
     def initialize_grid(self):
         """Function for creating underlying tile map for the grid. Currently the sizes and locations of corridors are hard-coded."""
         # setup underlying grid
@@ -423,6 +424,11 @@ class Window():
 
     def generate_display(self):
         """Function for generating tile grid during initialization."""
+        # cell neighbourhoods: neighbour index arrays shared by every grid of this size, looked up in the tiles by row-major index
+        # (filled in below, the trailing None is the out of bounds tile at index -1)
+        self.neighbours = neighbour_indices(self.width, self.height)
+        self.tiles = []
+
         # generate cells
         for y in range(0, self.height):
             row = []
@@ -430,11 +436,62 @@ class Window():
                 row.append(Tile(x, y, self.grid[y][x], self))
             self.tileset.append(row)
 
-        # define cell neighbourhoods
-        for y in range(0, self.height):
-            for x in range(0, self.width):
-                tile = self.tileset[y][x]
-                tile.neighbours = Neighbours(x, y, self.width, self.height, self.tileset)
+        self.tiles.extend([tile for row in self.tileset for tile in row] + [None])
+
+    # ==============================================================================================================================#
+    # main functionality
+
+    def step(self):
+        """Advances the simulation by one subtick: the wind is updated first, then tile updates are propagated."""
+        # update wind
+        perlinvalue = self.perlin(self.perlincount/15)
+        self.wind = set_windmap((2*sigmoid(1.5*(perlinvalue)) - 1)/(sigmoid(1)-sigmoid(-1)))
+        self.perlincount += 1
+
+        # increment tick count
+        self.tick += 1/8
+
+        # CA update
+        self.update_tileset()
+
+    def run(self, ticks):
+        """Steps the simulation a given number of subticks as fast as possible."""
+        for i in range(ticks):
+            self.step()
+        return(self)
+
+    def update_tileset(self):
+        """Update loop for all tiles on each tick."""
+        # applies update rules to all tiles, then applies update visuals to all tiles
+        tick = round(self.tick, 1)
+        list(map(lambda x: list(map(lambda t: t.UpdateRules(tick, self.wind), x)), self.tileset))
+        list(map(lambda x: list(map(lambda t: t.UpdateVisuals(tick, self.wind), x)), self.tileset))
+
+# ==============================================================================================================================#
+# Window class
+
+class Window(Simulation):
+    """Window class: a Simulation drawn to a pygame window, updated at a capped frame rate."""
+
+    # ==============================================================================================================================#
+    # initialization
+
+    def __init__(self, height, width, scale, seed=1256471):
+        """Window initialization."""
+        print(f"initial seed: {seed}")
+
+        # pygame window properties
+        pygame.init()
+        screen = pygame.display.set_mode((width*scale, height*scale))
+        screen.fill("black")
+        self.clock = pygame.time.Clock()
+
+        super().__init__(height, width, scale, seed, screen)
+
+        # show the initial grid, then begin mainloop
+        pygame.display.update()
+        self.dirty.clear()
+        self.mainloop()
 
     # ==============================================================================================================================#
     # main functionality
@@ -447,32 +504,20 @@ class Window():
                 if event.type == pygame.QUIT:
                     pygame.quit()
                     os._exit(0)
-            
-            # update wind
-            perlinvalue = self.perlin(self.perlincount/15)
-            self.wind = set_windmap((2*sigmoid(1.5*(perlinvalue)) - 1)/(sigmoid(1)-sigmoid(-1)))
-            self.perlincount += 1
-
-            # increment tick count
-            self.tick += 1/8
 
-            # CA update
-            self.update_tileset()
+            # wind and CA update
+            self.step()
 
-            pygame.display.update()
+            # only push the parts of the screen that were drawn this update
+            pygame.display.update(merge_rects(self.dirty))
+            self.dirty.clear()
 
             self.clock.tick(30)     # debug: 60 fps
             #self.clock.tick(240)    # cap fps (8 updates every 1/30th second, so 8*30 = 240
 
-    def update_tileset(self):
-        """Update loop for all tiles on each tick."""
-        # applies update rules to all tiles, then applies update visuals to all tiles
-        tick = round(self.tick, 1)
-        list(map(lambda x: list(map(lambda t: t.UpdateRules(tick, self.wind), x)), self.tileset))
-        list(map(lambda x: list(map(lambda t: t.UpdateVisuals(tick, self.wind), x)), self.tileset))
-
 
 # ==============================================================================================================================#
 # test code
 
-Window(40, 220, 5)
+if __name__ == "__main__":
+    Window(40, 220, 5)
@@ -0,0 +1,87 @@
+import argparse, ast, csv, itertools, multiprocessing, os, sys, time
+
+# ==============================================================================================================================#
+# Parameter sweep runner
+# every combination of the parameter grid is run headless in its own worker process, and the summary metrics of each run
+# (infections, bus stop throughput and peak Pv exposure) are gathered into one result table.
+#
+# usage: python sweep.py wavespread --ticks 2000 --set "seed=[1256471, 4502191]" --set "infectivity=[50, 100]" --out results.csv
+
+# build folders, each build is imported on its own inside the worker processes (the builds share module names)
+BUILDS = {"wavespread": "build02032022", "block": "build14022022"}
+
+# default parameter grids, the keys are keyword arguments of each build's Simulation class
+GRIDS = {"wavespread": {"seed": [1256471, 4502191],
+                        "engine": ["grid"],     # fastest over sweep-length runs: ~100 vs ~28 ticks/s for the sparse tiles at 1000 ticks
+                        "ticksize": [9],
+                        "spawnrates": [{"boarder": 5, "walker": 2, "departer": 5}],
+                        "infectivity": [100],
+                        "windcoefficients": [(0.2, 0.3)]},
+         "block": {"seed": [1256471, 4502191],
+                   "distance": [True, False]}}
+
+METRICS = ["infections", "boarded", "departed", "throughput", "peakpv"]
+
+def init_worker(build):
+    """Puts the build folder on the import path of a worker process."""
+    os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), BUILDS[build]))
+
+def run_one(task):
+    """Runs one simulation for the given number of ticks (frames in the block build) and returns its row of the result table."""
+    build, params, ticks = task
+    start = time.perf_counter()
+    if build == "wavespread":
+        import wavespreadfullversion as model
+        sim = model.Simulation(40, 220, **params)
+        sim.run(ticks*sim.ticksize)
+    else:
+        import mainblockversion as model
+        sim = model.Simulation(40, 220, **params)
+        sim.run(ticks)
+
+    row = dict(params)
+    row.update(sim.stats)
+    row["throughput"] = sim.stats["boarded"] + sim.stats["departed"]
+    row["ticks"] = ticks
+    row["seconds"] = round(time.perf_counter() - start, 3)
+    return(row)
+
+def expand(grid):
+    """Every combination of the values in a parameter grid, as a list of keyword dictionaries."""
+    keys = list(grid)
+    return([dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))])
+
+def sweep(build, grid, ticks, processes=None):
+    """Fans the runs of a parameter grid out over a process pool, results are returned in grid order."""
+    tasks = [(build, params, ticks) for params in expand(grid)]
+    with multiprocessing.Pool(processes, initializer=init_worker, initargs=(build,)) as pool:
+        return(pool.map(run_one, tasks, chunksize=1))
+
+def write_table(rows, grid, out):
+    """Writes the result table as csv, one row per run."""
+    fields = list(grid) + ["ticks", "seconds"] + METRICS
+    writer = csv.DictWriter(out, fields, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a parameter sweep of headless simulations over a process pool.")
+    parser.add_argument("build", choices=list(BUILDS))
+    parser.add_argument("--ticks", type=int, default=1200, help="ticks to simulate per run (frames in the block build)")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (defaults to every core)")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUES",
+                        help="replace a grid entry with a python list literal of values, e.g. \"distance=[True]\"")
+    parser.add_argument("--out", default=None, help="csv file for the result table (printed if not given)")
+    args = parser.parse_args()
+
+    grid = dict(GRIDS[args.build])
+    for entry in args.set:
+        key, values = entry.split("=", 1)
+        grid[key.strip()] = ast.literal_eval(values)
+
+    rows = sweep(args.build, grid, args.ticks, args.processes)
+    if args.out:
+        with open(args.out, "w", newline="") as out: write_table(rows, grid, out)
+    else:
+        write_table(rows, grid, sys.stdout)